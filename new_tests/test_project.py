@@ -8,7 +8,7 @@ from msmbuilder import Project
 import numpy.testing as npt
 from nose.tools import ok_, eq_
 import tempfile, shutil
-from common import reference_dir, skip
+from common import reference_dir
 
 
 def test_project_1():
@@ -32,7 +32,7 @@ def run(project, pdb, metric, traj_fn = None):
     ppdb = metric.prepare_trajectory(pdb)
     
     if traj_fn == None:
-        distances = -1 * np.ones((project.n_trajs, np.max(project.traj_lengths)))
+        distances = np.full((project.n_trajs, np.max(project.traj_lengths)), -1.0)
 
         for i in xrange(project.n_trajs):
             logger.info("Working on Trajectory %d", i )
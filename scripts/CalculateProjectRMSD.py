@@ -30,7 +30,7 @@ logger = logging.getLogger(__name__)
 
 
 def run(project, pdb, atom_indices):    
-    distances = -1 * np.ones((project.n_trajs, np.max(project.n_trajs)))
+    distances = np.full((project.n_trajs, np.max(project.n_trajs)), -1.0)
     rmsd = RMSD(atom_indices)
     ppdb = rmsd.prepare_trajectory(pdb)
     
@@ -2,6 +2,8 @@
 
 import sys, os
 import warnings
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 from msmbuilder import arglib
 from msmbuilder import clustering
 from msmbuilder import Project
@@ -48,6 +50,10 @@ parser.add_argument( dest='distances', help='''Output assignments distances file
 parser.add_argument( dest='generators', help='''Output trajectory file containing
     the structures of each of the cluster centers. Note that for hierarchical clustering
     methods, this file will not be produced.''', default='Data/Gens.lh5')
+parser.add_argument( dest='distances_dtype', help='''Storage dtype for the output
+    distances file. The distances are diagnostic tolerances, so half precision
+    is usually plenty and halves the file size and write time.''',
+    default='float16', choices=['float16', 'float32'])
 
 ################################################################################
 
@@ -113,12 +119,16 @@ for metric_parser in parser.metric_parsers: # arglib stores the metric subparser
 def load_trajectories(projectfn, stride):
     project = Project.load_from(projectfn)
 
-    list_of_trajs = []
-    for i in xrange(project.n_trajs):
-        # note, LoadTraj is only using the fast strided loading for
-        # HDF5 formatted trajs
-        traj = project.load_traj(i, stride=stride)
-        list_of_trajs.append(traj)
+    # note, LoadTraj is only using the fast strided loading for
+    # HDF5 formatted trajs. loading is I/O bound, so a thread pool keeps
+    # the filesystem busy while the HDF5 library decompresses in C
+    pool = ThreadPool(max(1, min(project.n_trajs, multiprocessing.cpu_count())))
+    try:
+        list_of_trajs = pool.map(lambda i: project.load_traj(i, stride=stride),
+                                 range(project.n_trajs))
+    finally:
+        pool.close()
+        pool.join()
 
     return list_of_trajs
 
@@ -187,13 +197,13 @@ could stride a little at the begining, but its not recommended.""")
         logger.info('Saving %s', args.generators)
         generators.save_to_lhdf(args.generators)
         if args.stride == 1:
-            assignments = clusterer.get_assignments()
-            distances = clusterer.get_distances()
-            
+            # one pass for both arrays, rather than splitting/repacking twice
+            assignments, distances = clusterer.get_assignments_and_distances()
+
             logger.info('Since stride=1, Saving %s', args.assignments)
             logger.info('Since stride=1, Saving %s', args.distances)
             io.saveh(args.assignments, assignments)
-            io.saveh(args.distances, distances)
+            io.saveh(args.distances, distances.astype(args.distances_dtype))
 
 if __name__ == '__main__':
     args, metric = parser.parse_args()
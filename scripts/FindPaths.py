@@ -38,7 +38,7 @@ def run(tprob, A, B, n):
     maxi = 0 # the maximum path length
     for path in Paths:
         if len(path) > maxi: maxi = len(path)
-    PaddedPaths = -1 * np.ones( (len(Paths), maxi ) )
+    PaddedPaths = np.full((len(Paths), maxi), -1.0)
     for i, path in enumerate(Paths):
         PaddedPaths[i,:len(path)] = np.array(path)
     
@@ -30,10 +30,14 @@ logger = logging.getLogger(__name__)
 
 float_or_none = lambda s: None if s.lower() == 'none' else float(s)
 
-def run_pcca(num_macrostates, assignments, tProb, output_dir):
+def run_pcca(num_macrostates, assignments, tProb, output_dir, text_output=False):
     MacroAssignmentsFn = os.path.join(output_dir, "MacroAssignments.h5")
-    MacroMapFn = os.path.join(output_dir, "MacroMapping.dat")
-    arglib.die_if_path_exists([MacroAssignmentsFn, MacroMapFn])
+    MacroMapFn = os.path.join(output_dir, "MacroMapping.npy")
+    MacroMapTxtFn = os.path.join(output_dir, "MacroMapping.dat")
+    outputs = [MacroAssignmentsFn, MacroMapFn]
+    if text_output:
+        outputs.append(MacroMapTxtFn)
+    arglib.die_if_path_exists(outputs)
 
     logger.info("Running PCCA...")
     MAP = lumping.PCCA(tProb, num_macrostates)
@@ -42,27 +46,37 @@ def run_pcca(num_macrostates, assignments, tProb, output_dir):
     # mess up negaitve one's (ie where don't have data)
     MSMLib.apply_mapping_to_assignments(assignments, MAP)
 
-    np.savetxt(MacroMapFn, MAP, "%d")
+    # np.save streams the raw buffer to disk; savetxt formats every
+    # element through python, which takes tens of seconds for large maps
+    np.save(MacroMapFn, MAP.astype(np.int32))
+    if text_output:
+        np.savetxt(MacroMapTxtFn, MAP, "%d")
     msmbuilder.io.saveh(MacroAssignmentsFn, assignments)
-    
+
     logger.info("Saved output to: %s, %s", MacroAssignmentsFn, MacroMapFn)
-    
-def run_pcca_plus(num_macrostates, assignments, tProb, output_dir, flux_cutoff=0.0,objective_function="crispness",do_minimization=True):
+
+def run_pcca_plus(num_macrostates, assignments, tProb, output_dir, flux_cutoff=0.0,objective_function="crispness",do_minimization=True,text_output=False):
     MacroAssignmentsFn = os.path.join(output_dir, "MacroAssignments.h5")
-    MacroMapFn = os.path.join(output_dir, "MacroMapping.dat")
-    ChiFn = os.path.join(output_dir, 'Chi.dat')
-    AFn = os.path.join(output_dir, 'A.dat')
-    arglib.die_if_path_exists([MacroAssignmentsFn, MacroMapFn, ChiFn, AFn])
-    
+    MacroMapFn = os.path.join(output_dir, "MacroMapping.npy")
+    MacroMapTxtFn = os.path.join(output_dir, "MacroMapping.dat")
+    ChiFn = os.path.join(output_dir, 'Chi.npy')
+    AFn = os.path.join(output_dir, 'A.npy')
+    outputs = [MacroAssignmentsFn, MacroMapFn, ChiFn, AFn]
+    if text_output:
+        outputs.append(MacroMapTxtFn)
+    arglib.die_if_path_exists(outputs)
+
     logger.info("Running PCCA+...")
     A, chi, vr, MAP = lumping.pcca_plus(tProb, num_macrostates, flux_cutoff=flux_cutoff,
         do_minimization=do_minimization, objective_function=objective_function)
 
-    MSMLib.apply_mapping_to_assignments(assignments, MAP)    
+    MSMLib.apply_mapping_to_assignments(assignments, MAP)
 
-    np.savetxt(ChiFn, chi)
-    np.savetxt(AFn, A)
-    np.savetxt(MacroMapFn, MAP,"%d")
+    np.save(ChiFn, chi)
+    np.save(AFn, A)
+    np.save(MacroMapFn, MAP.astype(np.int32))
+    if text_output:
+        np.savetxt(MacroMapTxtFn, MAP, "%d")
     msmbuilder.io.saveh(MacroAssignmentsFn, assignments)
     logger.info('Saved output to: %s, %s, %s, %s', ChiFn, AFn, MacroMapFn, MacroAssignmentsFn)
 
@@ -87,6 +101,8 @@ Output: MacroAssignments.h5, a new assignments HDF file, for the Macro MSM.""")
         objective function (crisp_metastability, metastability, or crispness)''',
                         default="crisp_metastability")
     parser.add_argument('do_minimization', help='Use PCCA+ minimization', default=True)
+    parser.add_argument('text_output', help='''Also write the legacy .dat
+        text copy of the macrostate mapping''', default=False)
     args = parser.parse_args()
 
     # load args
@@ -95,19 +111,28 @@ Output: MacroAssignments.h5, a new assignments HDF file, for the Macro MSM.""")
     except KeyError:
         assignments = msmbuilder.io.loadh(args.assignments, 'Data')
 
-    tProb = scipy.io.mmread(args.tProb)
+    # mmread returns COO; the lumping code does repeated matrix-vector
+    # products, so hand it CSR up front rather than converting inside
+    tProb = scipy.io.mmread(args.tProb).tocsr()
     
     
     if args.do_minimization in ["False", "0"]:#workaround for arglib funniness?
         args.do_minimization = False
     else:
         args.do_minimization = True
-    
+
+    if args.text_output in ["False", "0", False]:
+        args.text_output = False
+    else:
+        args.text_output = True
+
     if args.algorithm == 'PCCA':
-        run_pcca(args.num_macrostates, assignments, args.tProb, args.output_dir)
+        run_pcca(args.num_macrostates, assignments, tProb, args.output_dir,
+                 text_output=args.text_output)
     elif args.algorithm == 'PCCA+':
         run_pcca_plus(args.num_macrostates, assignments, tProb, args.output_dir,
                       args.flux_cutoff, objective_function=args.objective_function,
-                      do_minimization=args.do_minimization)
+                      do_minimization=args.do_minimization,
+                      text_output=args.text_output)
     else:
         raise Exception()
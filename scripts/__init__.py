@@ -37,7 +37,6 @@ __all__ = [
 "PlotImpliedTimescales",
 "RebuildProject",
 "TrimAssignments",
-"UpdateProjectToHDF5",
 "SavePDBs"
 ]
 
@@ -119,10 +119,15 @@ def configuration(parent_package='',top_path=None):
                     include_dirs = ["src/ext/molfile_plugin/include/",
                                     "src/ext/molfile_plugin"])
     # rmsd
+    rmsd_compile_args = ["-std=c99","-O2",
+                         "-msse2","-msse3","-fopenmp"]
+    # opt-in AVX2/FMA build of the theobald kernel. the binary won't run on
+    # CPUs without AVX2 support, so this is not turned on by default
+    if os.environ.get('MSMBUILDER_AVX2', None):
+        rmsd_compile_args.extend(["-mavx2", "-mfma"])
     rmsd = Extension('msmbuilder._rmsdcalc',
                      sources=glob('src/ext/IRMSD/*.c'),
-                     extra_compile_args = ["-std=c99","-O2",
-                                           "-msse2","-msse3","-fopenmp"],
+                     extra_compile_args = rmsd_compile_args,
                      extra_link_args = ['-lgomp'],
                      include_dirs = [numpy.get_include(), os.path.join(numpy.get_include(), 'numpy')])
 
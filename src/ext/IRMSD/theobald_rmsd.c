@@ -38,6 +38,9 @@
 #ifdef __SSE3__
 #include <pmmintrin.h>
 #endif
+#ifdef __AVX2__
+#include <immintrin.h>
+#endif
 
 #ifndef max
 #define max( a, b ) ( ((a) > (b)) ? (a) : (b) )
@@ -325,6 +328,85 @@ real ls_rmsd2_aligned_T_g(const int nrealatoms, const int npaddedatoms, const in
     const float* bTz = bT+2*rowstride;
 
 
+#ifdef __AVX2__
+    // AVX2 path: accumulate the nine entries of M = A.B' eight atoms at a
+    // time. The structures are zero-padded, so running over the padding is
+    // harmless; any tail that is a multiple of 4 but not 8 is handled by a
+    // short scalar loop below.
+#ifdef __FMA__
+#define MSMB_MM256_FMADD(a, b, c) _mm256_fmadd_ps((a), (b), (c))
+#else
+#define MSMB_MM256_FMADD(a, b, c) _mm256_add_ps(_mm256_mul_ps((a), (b)), (c))
+#endif
+    {
+        __m256 axx = _mm256_setzero_ps(), axy = _mm256_setzero_ps(), axz = _mm256_setzero_ps();
+        __m256 ayx = _mm256_setzero_ps(), ayy = _mm256_setzero_ps(), ayz = _mm256_setzero_ps();
+        __m256 azx = _mm256_setzero_ps(), azy = _mm256_setzero_ps(), azz = _mm256_setzero_ps();
+        __m256 vax, vay, vaz, vb;
+        __m128 lo, hi;
+        float hsums[9];
+        int niters8 = npaddedatoms >> 3;
+        int k, j;
+
+        for (k = 0; k < niters8; k++) {
+            vax = _mm256_loadu_ps(aTx);
+            vay = _mm256_loadu_ps(aTy);
+            vaz = _mm256_loadu_ps(aTz);
+
+            vb = _mm256_loadu_ps(bTx);
+            axx = MSMB_MM256_FMADD(vax, vb, axx);
+            ayx = MSMB_MM256_FMADD(vay, vb, ayx);
+            azx = MSMB_MM256_FMADD(vaz, vb, azx);
+
+            vb = _mm256_loadu_ps(bTy);
+            axy = MSMB_MM256_FMADD(vax, vb, axy);
+            ayy = MSMB_MM256_FMADD(vay, vb, ayy);
+            azy = MSMB_MM256_FMADD(vaz, vb, azy);
+
+            vb = _mm256_loadu_ps(bTz);
+            axz = MSMB_MM256_FMADD(vax, vb, axz);
+            ayz = MSMB_MM256_FMADD(vay, vb, ayz);
+            azz = MSMB_MM256_FMADD(vaz, vb, azz);
+
+            aTx += 8;
+            aTy += 8;
+            aTz += 8;
+            bTx += 8;
+            bTy += 8;
+            bTz += 8;
+        }
+
+        // horizontal reduction of the eight lanes in each accumulator,
+        // written out in the same order the SSE path stores M
+        {
+            __m256 accs[9] = {axx, axy, axz, ayx, ayy, ayz, azx, azy, azz};
+            for (j = 0; j < 9; j++) {
+                lo = _mm256_castps256_ps128(accs[j]);
+                hi = _mm256_extractf128_ps(accs[j], 1);
+                lo = _mm_add_ps(lo, hi);
+                lo = _mm_hadd_ps(lo, lo);
+                lo = _mm_hadd_ps(lo, lo);
+                hsums[j] = _mm_cvtss_f32(lo);
+            }
+        }
+
+        // scalar tail for structures padded to a multiple of 4 but not 8
+        for (k = niters8 << 3; k < npaddedatoms; k++) {
+            hsums[0] += aTx[k - (niters8 << 3)] * bTx[k - (niters8 << 3)];
+            hsums[1] += aTx[k - (niters8 << 3)] * bTy[k - (niters8 << 3)];
+            hsums[2] += aTx[k - (niters8 << 3)] * bTz[k - (niters8 << 3)];
+            hsums[3] += aTy[k - (niters8 << 3)] * bTx[k - (niters8 << 3)];
+            hsums[4] += aTy[k - (niters8 << 3)] * bTy[k - (niters8 << 3)];
+            hsums[5] += aTy[k - (niters8 << 3)] * bTz[k - (niters8 << 3)];
+            hsums[6] += aTz[k - (niters8 << 3)] * bTx[k - (niters8 << 3)];
+            hsums[7] += aTz[k - (niters8 << 3)] * bTy[k - (niters8 << 3)];
+            hsums[8] += aTz[k - (niters8 << 3)] * bTz[k - (niters8 << 3)];
+        }
+
+        for (j = 0; j < 9; j++)
+            M[j] = hsums[j];
+    }
+#else
     // npaddedatoms must be a multiple of 4
     int niters = npaddedatoms >> 2;
     __m128 xx,xy,xz,yx,yy,yz,zx,zy,zz;
@@ -493,6 +575,7 @@ real ls_rmsd2_aligned_T_g(const int nrealatoms, const int npaddedatoms, const in
     _mm_store_ps(M  , xx);
     _mm_store_ps(M+4, yy);
     _mm_store_ps(M+8, zz);
+#endif
 
     return rmsd2FromMandG(M,G_a,G_b,nrealatoms);
 }
@@ -372,13 +372,14 @@ def apply_mapping_to_assignments(assignments, mapping):
 
     """
 
-    NewMapping = mapping.copy()
     # Make a special state for things that get deleted by Ergodic Trimming.
-    NewMapping[np.where(mapping == -1)] = mapping.max() + 1
+    eliminated_state = mapping.max() + 1
+    NewMapping = mapping.copy()
+    NewMapping[mapping == -1] = eliminated_state
 
-    NegativeOneStates = np.where(assignments == -1)
+    NegativeOneStates = (assignments == -1)
     assignments[:] = NewMapping[assignments]
-    WhereEliminatedStates = np.where(assignments == (mapping.max() + 1))
+    WhereEliminatedStates = (assignments == eliminated_state)
 
     # These are the dangling 'tails' of trajectories (with no actual data) that we denote state -1.
     assignments[NegativeOneStates] = -1
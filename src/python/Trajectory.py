@@ -315,7 +315,7 @@ class Trajectory(ConformationBaseClass):
 
     @classmethod
     def load_from_xtc(cls, XTCFilenameList, PDBFilename=None, Conf=None, PreAllocate=True,
-                    JustInspect=False, discard_overlapping_frames=False):
+                    JustInspect=False, discard_overlapping_frames=False, Stride=1):
         """Create a Trajectory from a collection of XTC files
 
         Parameters
@@ -336,6 +336,10 @@ class Trajectory(ConformationBaseClass):
             Dont actually load, just return dimensions
         discard_overallping_frames: bool, optional
             Check for redundant frames and discard them. (RTM 6/27 should this be default True?)
+        Stride: int, optional
+            Only keep every Stride'th frame. The skipped frames are never
+            appended, so the full-resolution coordinates are not held in
+            memory as they would be by slicing after the load.
 
         Returns
         -------
@@ -354,17 +358,17 @@ class Trajectory(ConformationBaseClass):
 
             A["XYZList"] = []
             num_redundant = 0
+            previous_coords = None
 
             for i, c in enumerate(xtc.XTCReader(XTCFilenameList)):
                 # check to see if we have redundant frames as we load them up
-                if discard_overlapping_frames:
-                    if i > 0:
-                        if np.sum(np.abs(c.coords - A["XYZList"][-1])) < 10. ** -8:
-                            num_redundant += 1
-                    A["XYZList"].append(np.array(c.coords).copy())
+                if discard_overlapping_frames and previous_coords is not None:
+                    if np.sum(np.abs(c.coords - previous_coords)) < 10. ** -8:
+                        num_redundant += 1
+                previous_coords = np.array(c.coords).copy()
 
-                else:
-                    A["XYZList"].append(np.array(c.coords).copy())
+                if i % Stride == 0:
+                    A["XYZList"].append(previous_coords)
 
             A["XYZList"] = np.array(A["XYZList"])
             if num_redundant != 0:
@@ -383,7 +387,7 @@ class Trajectory(ConformationBaseClass):
         return(A)
 
     @classmethod
-    def load_from_dcd(cls, FilenameList, PDBFilename=None, Conf=None, PreAllocate=True, JustInspect=False):
+    def load_from_dcd(cls, FilenameList, PDBFilename=None, Conf=None, PreAllocate=True, JustInspect=False, Stride=1):
         """Create a Trajectory from a Filename."""
 
         if PDBFilename != None:
@@ -395,8 +399,9 @@ class Trajectory(ConformationBaseClass):
 
         if not JustInspect:
             A["XYZList"] = []
-            for c in dcd.DCDReader(FilenameList):
-                A["XYZList"].append(c.copy())
+            for i, c in enumerate(dcd.DCDReader(FilenameList)):
+                if i % Stride == 0:
+                    A["XYZList"].append(c.copy())
             A["XYZList"] = np.array(A["XYZList"])
         else:  # This is wasteful to read everything in just to get the length
             XYZ = []
@@ -511,10 +516,13 @@ class Trajectory(ConformationBaseClass):
 
         for r0, r1 in zip(begin_range_list, end_range_list):
 
+            # the pytables selection already returns a freshly-allocated
+            # ndarray, so wrapping it in np.array() would just copy each
+            # chunk a second time
             if RestrictAtoms:
-                A['XYZList'] = np.array(F.root.XYZList[r0: r1: Stride, AtomIndices])
+                A['XYZList'] = F.root.XYZList[r0: r1: Stride, AtomIndices]
             else:
-                A['XYZList'] = np.array(F.root.XYZList[r0: r1: Stride])
+                A['XYZList'] = F.root.XYZList.read(r0, r1, Stride)
 
             yield cls(A)
 
@@ -677,12 +685,12 @@ class Trajectory(ConformationBaseClass):
         elif extension == '.xtc':
             if Conf == None:
                 raise Exception("Need to register a Conformation to use XTC Reader.")
-            return Trajectory.load_from_xtc(Filename, Conf=Conf, JustInspect=JustInspect)[::Stride]
+            return Trajectory.load_from_xtc(Filename, Conf=Conf, JustInspect=JustInspect, Stride=Stride)
 
         elif extension == '.dcd':
             if Conf == None:
                 raise Exception("Need to register a Conformation to use DCD Reader.")
-            return Trajectory.load_from_dcd(Filename, Conf=Conf, JustInspect=JustInspect)[::Stride]
+            return Trajectory.load_from_dcd(Filename, Conf=Conf, JustInspect=JustInspect, Stride=Stride)
 
         elif extension == '.lh5':
             return Trajectory.load_from_lhdf(Filename, JustInspect=JustInspect, Stride=Stride)
@@ -1,4 +1,6 @@
 import os
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import numpy as np
 import tables
 import warnings
@@ -7,7 +9,7 @@ from msmbuilder import Trajectory
 import logging
 logger = logging.getLogger('assigning')
 
-def _setup_containers(project, assignments_fn, distances_fn):
+def _setup_containers(project, assignments_fn, distances_fn, assignment_dtype=np.int):
     """
     Setup the files on disk (Assignments.h5 and Assignments.h5.distances) that
     results will be sent to.
@@ -24,21 +26,47 @@ def _setup_containers(project, assignments_fn, distances_fn):
 
     distances_fn : string
 
+    assignment_dtype : np.dtype
+        Integer type for the assignments container. With fewer than 2**15
+        generators, int16 halves the file and the read bandwidth relative
+        to int32.
+
     Returns
     -------
     f_assignments : tables.File
         pytables handle to the assignments file, open in 'append' mode
     f_distances : tables.File
         pytables handle to the assignments file, open in 'append' mode
+
+    Notes
+    -----
+    The handles are meant to be held open for the whole assignment run and
+    closed once at the end -- reopening the files at every checkpoint is
+    expensive. For the same reason, do not open them before forking worker
+    processes; an HDF5 handle must not be shared across a fork, so any
+    process-level parallelism should open its own handles in the children.
     """
 
     def save_container(filename, dtype):
-        io.saveh(filename, arr_0=-1*np.ones((project.n_trajs, np.max(project.traj_lengths)), dtype=dtype),
-                 completed_trajs=np.zeros((project.n_trajs), dtype=np.bool))
+        # chunk the assignments array by rows, so that checkpointing one
+        # trajectory rewrites exactly one compressed chunk on disk. The -1
+        # sentinel comes from the atom's default fill value, so the
+        # (n_trajs, max_len) array is never materialized in memory and
+        # untouched chunks are never written to disk
+        n_rows, n_cols = project.n_trajs, project.max_traj_length
+        handle = tables.openFile(filename, 'w')
+        handle.createCArray(where='/', name='arr_0',
+            atom=tables.Atom.from_dtype(np.dtype(dtype), dflt=-1),
+            shape=(n_rows, n_cols), chunkshape=(1, n_cols),
+            filters=io.CHECKPOINT_COMPRESSION)
+        handle.createCArray(where='/', name='completed_trajs',
+            atom=tables.BoolAtom(dflt=False), shape=(n_rows,),
+            filters=io.CHECKPOINT_COMPRESSION)
+        handle.close()
 
     def check_container(filename):
         fh = tables.openFile(filename, 'r')
-        if  fh.root.arr_0.shape != (project.n_trajs, np.max(project.traj_lengths)):
+        if  fh.root.arr_0.shape != (project.n_trajs, project.max_traj_length):
             raise ValueError('Shape error 1')
         if fh.root.completed_trajs.shape != (project.n_trajs,):
             raise ValueError('Shape error 2')
@@ -47,7 +75,7 @@ def _setup_containers(project, assignments_fn, distances_fn):
     # save assignments container
     if (not os.path.exists(assignments_fn)) \
             and (not os.path.exists(distances_fn)):
-        save_container(assignments_fn, np.int)
+        save_container(assignments_fn, assignment_dtype)
         save_container(distances_fn, np.float32)
     elif os.path.exists(assignments_fn) and os.path.exists(distances_fn):
         check_container(assignments_fn)
@@ -62,30 +90,198 @@ def _setup_containers(project, assignments_fn, distances_fn):
     return f_assignments, f_distances
 
 
-def assign_in_memory(metric, generators, project):
-    """This really should be called simple assign -- its the simplest"""
+# one-slot cache for the prepared generators. Hyperparameter sweeps call
+# the assign entry points many times with the same metric and generators,
+# and there's no reason to re-prepare (recenter, re-transform, copy) them
+# on every call. Strong references are held, so the identity test is safe.
+_pgens_cache = {'metric': None, 'generators': None, 'pgens': None}
+
+# per-generator squared norms for the GEMM distance expansion. These are
+# invariant across every frame, chunk and trajectory assigned against the
+# same generators, so they're computed once and looked up by identity
+_gen_sqnorms_cache = {'pgens': None, 'sqnorms': None}
+
+
+def _generator_sqnorms(pgens):
+    """Squared L2 norm of each generator, memoized on the pgens array"""
+    if _gen_sqnorms_cache['pgens'] is not pgens:
+        _gen_sqnorms_cache['pgens'] = pgens
+        _gen_sqnorms_cache['sqnorms'] = np.sum(np.asarray(pgens, dtype=np.double) ** 2, axis=1)
+    return _gen_sqnorms_cache['sqnorms']
 
-    n_trajs, max_traj_length = project.n_trajs, np.max(project.traj_lengths)
-    assignments = -1 * np.ones((n_trajs, max_traj_length), dtype='int')
-    distances = -1 * np.ones((n_trajs, max_traj_length), dtype='float32')
+
+def _prepare_generators(metric, generators):
+    """Prepare the generator trajectory, memoizing the last result"""
+    if _pgens_cache['metric'] is metric and \
+            _pgens_cache['generators'] is generators:
+        return _pgens_cache['pgens']
 
     pgens = metric.prepare_trajectory(generators)
+    if isinstance(pgens, np.ndarray):
+        # make sure the C kernels see a contiguous buffer
+        pgens = np.ascontiguousarray(pgens)
+
+    _pgens_cache['metric'] = metric
+    _pgens_cache['generators'] = generators
+    _pgens_cache['pgens'] = pgens
+    return pgens
+
+
+def _assign_frames(metric, ptraj, pgens, frame_block=256, gen_block=256):
+    """
+    Assign every frame of a prepared trajectory to its closest generator
+
+    Parameters
+    ----------
+    metric : msmbuilder.metrics.AbstractDistanceMetric
+        A distance metric used to define "closest"
+    ptraj : prepared trajectory
+        Output of metric.prepare_trajectory on the frames to assign
+    pgens : prepared trajectory
+        Output of metric.prepare_trajectory on the generators
+    frame_block : int
+        Number of frames per tile, for metrics that support all_to_all
+    gen_block : int
+        Number of generators per tile. The tile sizes bound the distance
+        panel held in memory and keep the generator block cache-resident
+        while a whole block of frames streams against it. The defaults
+        keep the panel (frame_block x gen_block doubles) at half a
+        megabyte, inside L2 on current hardware, so the argmin reduction
+        reads it back from cache rather than DRAM and the working set
+        that actually touches main memory is just the two output arrays.
+
+    Returns
+    -------
+    assignments : ndarray, int
+        The index of the closest generator, for each frame
+    distances : ndarray, float32
+        The distance to that generator, for each frame
+
+    Notes
+    -----
+    Vectorized metrics provide all_to_all, which computes a whole tile of
+    frames against a tile of generators in one C-level call. We loop
+    generator tiles on the outside and frame tiles on the inside, keeping a
+    running (best distance, best index) per frame, so each generator tile is
+    loaded from main memory once per frame tile instead of once per frame.
+
+    For the euclidean metrics, the distance tile is computed with the BLAS
+    expansion ||x - g||^2 = ||x||^2 - 2 x.g + ||g||^2: one matrix multiply
+    per tile, which vectorizes across the generator dimension far better
+    than the pairwise cdist loops. The ||x||^2 term is the same for every
+    generator, so it is left out of the running minimum and added back
+    only when converting the winners to distances at the end.
+
+    Metrics without all_to_all (e.g. RMSD) only batch through one_to_all.
+    The distance is symmetric, so we loop over whichever side has fewer
+    frames: scanning the whole trajectory from each generator turns
+    n_frames python dispatches into n_gens, and each C call then covers
+    the full trajectory.
+    """
 
-    for i in xrange(n_trajs):
-        traj = project.load_traj(i)
-        ptraj = metric.prepare_trajectory(traj)
-        for j in xrange(len(traj)):
+    n = len(ptraj)
+
+    if not hasattr(metric, 'all_to_all'):
+        if len(pgens) < n:
+            best_d = np.empty(n, dtype=np.float32)
+            best_d.fill(np.inf)
+            best_i = np.full(n, -1, dtype=np.int)
+            for g in xrange(len(pgens)):
+                d = metric.one_to_all(pgens, ptraj, g)
+                better = d < best_d
+                best_d[better] = d[better]
+                best_i[better] = g
+            return best_i, best_d
+
+        assignments = np.empty(n, dtype=np.int)
+        distances = np.empty(n, dtype=np.float32)
+        for j in xrange(n):
             d = metric.one_to_all(ptraj, pgens, j)
-            assignments[i,j] = np.argmin(d)
-            distances[i,j] = d[assignments[i,j]]
+            ind = np.argmin(d)
+            assignments[j] = ind
+            distances[j] = d[ind]
+        return assignments, distances
+
+    use_gemm = (getattr(metric, 'metric', None) in ('euclidean', 'sqeuclidean')
+                and isinstance(ptraj, np.ndarray) and ptraj.ndim == 2)
+    if use_gemm:
+        # norms are taken on the caller's pgens so the memo keys on the
+        # long-lived array, not on the per-call double copy below
+        all_gen_sq = _generator_sqnorms(pgens)
+        ptraj = np.asarray(ptraj, dtype=np.double)
+        pgens = np.asarray(pgens, dtype=np.double)
+
+    n_gens = len(pgens)
+    best_d = np.empty(n, dtype=np.double)
+    best_d.fill(np.inf)
+    best_i = np.full(n, -1, dtype=np.int)
+
+    for g0 in xrange(0, n_gens, gen_block):
+        gtile = pgens[g0:g0 + gen_block]
+        if use_gemm:
+            gen_sq = all_gen_sq[g0:g0 + gen_block]
+        for f0 in xrange(0, n, frame_block):
+            if use_gemm:
+                d = gen_sq - 2.0 * np.dot(ptraj[f0:f0 + frame_block], gtile.T)
+            else:
+                d = metric.all_to_all(ptraj[f0:f0 + frame_block], gtile)
+            inds = np.argmin(d, axis=1)
+            dmin = d[np.arange(d.shape[0]), inds]
+            better = dmin < best_d[f0:f0 + frame_block]
+            best_d[f0:f0 + frame_block][better] = dmin[better]
+            best_i[f0:f0 + frame_block][better] = inds[better] + g0
+
+    if use_gemm:
+        # restore the dropped ||x||^2 term; clip at zero since the
+        # expansion can go slightly negative from cancellation
+        best_d = np.maximum(best_d + np.sum(ptraj ** 2, axis=1), 0)
+        if metric.metric == 'euclidean':
+            best_d = np.sqrt(best_d)
+
+    return best_i, best_d.astype(np.float32)
+
+
+def assign_in_memory(metric, generators, project, num_threads=None):
+    """This really should be called simple assign -- its the simplest
+
+    Trajectories are independent of one another (the generators are read
+    only, and each trajectory owns its output rows), so they are dispatched
+    to a thread pool. The heavy lifting inside each worker -- the metric's C
+    kernels and the HDF5 reads -- releases the GIL, so the threads genuinely
+    overlap. Set num_threads=1 to force the old serial behavior, e.g. if
+    you are already parallelizing at a different level (say via MPI).
+    """
+
+    n_trajs, max_traj_length = project.n_trajs, project.max_traj_length
+    # generator indices always fit an int32, and halving the element size
+    # halves the memory traffic on the biggest array this function touches
+    assignments = np.full((n_trajs, max_traj_length), -1, dtype=np.int32)
+    distances = np.full((n_trajs, max_traj_length), -1, dtype='float32')
+
+    pgens = _prepare_generators(metric, generators)
+
+    def assign_one(i):
+        ptraj = metric.prepare_trajectory(project.load_traj(i))
+        return len(ptraj), _assign_frames(metric, ptraj, pgens)
+
+    if num_threads is None:
+        num_threads = max(1, min(n_trajs, multiprocessing.cpu_count()))
+    pool = ThreadPool(num_threads)
+    try:
+        for i, (n, (traj_assignments, traj_distances)) in enumerate(pool.imap(assign_one, xrange(n_trajs))):
+            assignments[i, :n] = traj_assignments
+            distances[i, :n] = traj_distances
+    finally:
+        pool.close()
+        pool.join()
 
     return assignments, distances
 
 
-def assign_with_checkpoint(metric, project, generators, assignments_path, distances_path, chunk_size=10000):
+def assign_with_checkpoint(metric, project, generators, assignments_path, distances_path, chunk_size=10000, num_threads=None):
     """
     Assign every frame to its closest generator
-    
+
     Parameters
     ----------
     metric : msmbuilder.metrics.AbstractDistanceMetric
@@ -106,72 +302,89 @@ def assign_with_checkpoint(metric, project, generators, assignments_path, distan
         the number of frames you can fit in memory at any one time. Note, this
         is only important if your trajectories are long, as the effective chunk_size
         is really `min(traj_length, chunk_size)`
-        
+    num_threads : int
+        Number of worker threads assigning trajectories concurrently. The
+        default is one per core. Pass 1 to force serial operation.
+
     Notes
     -----
     The results will be checkpointed along the way, trajectory by trajectory. So if
     the process is killed, it should be able to roughly pick up where it left off.
+
+    The distance computation for different trajectories runs on a thread
+    pool (the metric's C kernels release the GIL), but all of the writes to
+    the output files happen here in the calling thread, so the containers
+    only ever have a single writer.
     """
 
-    pgens = metric.prepare_trajectory(generators)
-    
-    # setup the file handles
-    fh_a, fh_d = _setup_containers(project, assignments_path, distances_path)
+    pgens = _prepare_generators(metric, generators)
 
+    # setup the file handles. the state indices fit in an int16 for any
+    # usual number of generators, and the -1 padding still fits the dtype
+    if len(pgens) < np.iinfo(np.int16).max:
+        assignment_dtype = np.int16
+    else:
+        assignment_dtype = np.int32
+    fh_a, fh_d = _setup_containers(project, assignments_path, distances_path,
+                                   assignment_dtype)
+
+    remaining = []
     for i in xrange(project.n_trajs):
         if fh_a.root.completed_trajs[i] and fh_d.root.completed_trajs[i]:
             logger.info('Skipping trajectory %s -- already assigned', i)
             continue
         if fh_a.root.completed_trajs[i] or fh_d.root.completed_trajs[i]:
             raise RuntimeError('Corruption detected')
-        logger.info('Assigning trajectory %s', i)
-        
-        # pointer to the position in the total trajectory where
-        # the current chunk starts, so we know where in the Assignments
-        # array to put each batch of data
-        start_index = 0
-        
+        remaining.append(i)
+
+    # hand the longest trajectories to the pool first, so the run doesn't
+    # end with one worker grinding through a long trajectory while the
+    # others sit idle. Results are written by trajectory index, so the
+    # dispatch order doesn't change anything on disk
+    remaining.sort(key=lambda e: project.traj_lengths[e], reverse=True)
+
+    def assign_one(i):
+        # stream the trajectory in chunks so the coordinates for only
+        # chunk_size frames are in memory at once. The output rows are
+        # small, and their length is known up front from the project
+        # records, so they are preallocated and filled a chunk-slice at
+        # a time
+        n = project.traj_lengths[i]
+        assignments = np.empty(n, dtype=np.int)
+        distances = np.empty(n, dtype=np.float32)
+        off = 0
         for tchunk in Trajectory.enum_chunks_from_lhdf(project.traj_filename(i), ChunkSize=chunk_size):
             ptchunk = metric.prepare_trajectory(tchunk)
             this_length = len(ptchunk)
-            
-            distances = np.empty(this_length, dtype=np.float32)
-            assignments = np.empty(this_length, dtype=np.int)
-
-            for j in xrange(this_length):
-                d = metric.one_to_all(ptchunk, pgens, j)
-                ind = np.argmin(d)
-                assignments[j] = ind
-                distances[j] = d[ind]
-            
-            end_index = start_index+this_length
-            fh_a.root.arr_0[i, start_index:end_index] = assignments
-            fh_d.root.arr_0[i, start_index:end_index] = distances
-            
-            # i'm not sure exactly what the optimal flush frequency is
+            assignments[off:off + this_length], distances[off:off + this_length] = \
+                _assign_frames(metric, ptchunk, pgens)
+            off += this_length
+        return i, assignments[:off], distances[:off]
+
+    if num_threads is None:
+        num_threads = max(1, min(len(remaining), multiprocessing.cpu_count()))
+    pool = ThreadPool(max(1, num_threads))
+
+    try:
+        for i, assignments, distances in pool.imap(assign_one, remaining):
+            logger.info('Assigned trajectory %s', i)
+            n = len(assignments)
+            fh_a.root.arr_0[i, 0:n] = assignments
+            fh_d.root.arr_0[i, 0:n] = distances
+
+            # we're going to keep duplicates of this record -- i.e. writing
+            # it to both files. Only completed trajectories are checkpointed,
+            # so if the process dies mid-trajectory that trajectory is
+            # recomputed on restart
+            fh_a.root.completed_trajs[i] = True
+            fh_d.root.completed_trajs[i] = True
             fh_a.flush()
             fh_d.flush()
-            start_index = end_index
-                
-        # we're going to keep duplicates of this record -- i.e. writing
-        # it to both files
-
-        # completed chunks are not checkpointed -- only completed trajectories
-        # this means that if the process dies after completing 10/20 of the
-        # chunks in trajectory i -- those chunks are going to have to be recomputed
-        # (put trajectory i-1 is saved)
-
-        # this could be changed, but the implementation is a little tricky -- you
-        # have to watch out for the fact that the person might call this function
-        # with chunk_size=N, let it run for a while, kill it, and then call it
-        # again with chunk_size != N. Dealing with that appropriately is tricky
-        # since the chunks wont line up in the two cases
-        fh_a.root.completed_trajs[i] = True
-        fh_d.root.completed_trajs[i] = True
-
-    
-    fh_a.close()        
-    fh_d.close()
+    finally:
+        pool.close()
+        pool.join()
+        fh_a.close()
+        fh_d.close()
 
 def streaming_assign_with_checkpoint(metric, project, generators, assignments_path, distances_path, checkpoint=1,chunk_size=10000):
     warnings.warn("assign_with_checkpoint now uses the steaming engine -- this function is deprecated", DeprecationWarning)
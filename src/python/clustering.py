@@ -362,7 +362,7 @@ def _kcenters(metric, ptraj, k=None, distance_cutoff=None, seed=0, verbose=True)
         k = sys.maxint
 
     distance_list = np.inf * np.ones(len(ptraj), dtype=np.float32)
-    assignments = -1 * np.ones(len(ptraj), dtype=np.int32)
+    assignments = np.full(len(ptraj), -1, dtype=np.int32)
 
     generator_indices = []
     for i in xrange(k):
@@ -807,7 +807,7 @@ class Hierarchical(object):
             at the end if not all trajectories are the same length
         """
         assgn_list = split(self._oneD_assignments(k, cutoff_distance), self.traj_lengths)
-        output = -1 * np.ones((len(self.traj_lengths), max(self.traj_lengths)), dtype='int')
+        output = np.full((len(self.traj_lengths), max(self.traj_lengths)), -1, dtype='int')
         for i, traj_assign in enumerate(assgn_list):
             output[i][0:len(traj_assign)] = traj_assign
         return output
@@ -929,7 +929,7 @@ class BaseFlatClusterer(object):
             ptraj_index_to_gens_traj_index[g] = i
 
         # put twoD into a rectangular array
-        output = -1 * np.ones((len(self._traj_lengths), max(self._traj_lengths)), dtype=np.int32)
+        output = np.full((len(self._traj_lengths), max(self._traj_lengths)), -1, dtype=np.int32)
         for i, traj_assign in enumerate(twoD):
             output[i,0:len(traj_assign)] = ptraj_index_to_gens_traj_index[traj_assign]
 
@@ -951,11 +951,51 @@ class BaseFlatClusterer(object):
         twoD = split(self._distances, self._traj_lengths)
 
         # put twoD into a rectangular array
-        output = -1 * np.ones((len(self._traj_lengths), max(self._traj_lengths)), dtype='float32')
+        output = np.full((len(self._traj_lengths), max(self._traj_lengths)), -1, dtype='float32')
         for i, traj_distances in enumerate(twoD):
             output[i][0:len(traj_distances)] = traj_distances
         return output
 
+    def get_assignments_and_distances(self):
+        """Extract the assignments and the distance from each frame to its
+        assigned cluster center, in a single pass
+
+        Returns
+        -------
+        assignments : ndarray
+            Same as the return value of get_assignments()
+        distances : ndarray
+            Same as the return value of get_distances()
+
+        Notes
+        -----
+        Cheaper than calling get_assignments() followed by get_distances(),
+        which splits and repacks the concatenated results twice.
+        """
+
+        self._ensure_generators_computed()
+        self._ensure_assignments_and_distances_computed()
+
+        # the numbers in self._assignments are indices with respect to self.ptraj,
+        # but we want indices with respect to the number in the trajectory of generators
+        # returned by get_generators_as_traj()
+        ptraj_index_to_gens_traj_index = np.zeros(self.num_frames)
+        for i, g in enumerate(self._generator_indices):
+            ptraj_index_to_gens_traj_index[g] = i
+
+        n_trajs = len(self._traj_lengths)
+        max_length = max(self._traj_lengths)
+        assignments = np.full((n_trajs, max_length), -1, dtype=np.int32)
+        distances = np.full((n_trajs, max_length), -1, dtype='float32')
+
+        for i, (traj_assign, traj_distances) in enumerate(
+                zip(split(self._assignments, self._traj_lengths),
+                    split(self._distances, self._traj_lengths))):
+            assignments[i, 0:len(traj_assign)] = ptraj_index_to_gens_traj_index[traj_assign]
+            distances[i, 0:len(traj_distances)] = traj_distances
+
+        return assignments, distances
+
     def get_generators_as_traj(self):
         """Get a trajectory containing the generators
 
@@ -1221,7 +1261,7 @@ class HybridKMedoids(BaseFlatClusterer):
 #
 #    def get_assignments(self):
 #        assgn_list = split(self._assignments, self._traj_lengths)
-#        output = -1 * np.ones((len(self._traj_lengths), max(self._traj_lengths)), dtype='int')
+#        output = np.full((len(self._traj_lengths), max(self._traj_lengths)), -1, dtype='int')
 #        for i, traj_assign in enumerate(assgn_list):
 #            output[i][0:len(traj_assign)] = traj_assign
 #        return output
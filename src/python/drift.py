@@ -44,7 +44,7 @@ def _drift_single_trajectory(metric, trajectory, tau):
     
     traj_length = trajectory['XYZList'].shape[0]
     ptraj = metric.prepare_trajectory(trajectory)
-    distances = -1 * np.ones((len(tau), traj_length - np.min(tau)))
+    distances = np.full((len(tau), traj_length - np.min(tau)), -1.0)
     
     for i in xrange(traj_length - np.min(tau)):
         comp_indices = filter(lambda elem: elem < traj_length, tau + i)
@@ -113,7 +113,7 @@ def hitting_time(metric, trajectory, epsilon):
     traj_length = len(trajectory)
     ptraj = metric.prepare_trajectory(trajectory)
     window_length = 8
-    output = -1 * np.ones(len(trajectory), dtype=np.int)
+    output = np.full(len(trajectory), -1, dtype=np.int)
     
     for i in xrange(traj_length):
         found = False
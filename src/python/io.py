@@ -41,9 +41,15 @@ import tables
 
 try:
     COMPRESSION = tables.Filters(complevel=9, complib='blosc', shuffle=True)
+    # blosc is essentially free at low levels, while level 9 sits well past
+    # the compression/speed pareto point. Files that get rewritten while a
+    # computation runs (checkpoints) should use this filter; level 9 is for
+    # final artifacts that are written once and read many times
+    CHECKPOINT_COMPRESSION = tables.Filters(complevel=3, complib='blosc', shuffle=True)
 except Exception: #type?
     warnings.warn("Missing BLOSC; no compression will used.")
     COMPRESSION = tables.Filters()
+    CHECKPOINT_COMPRESSION = tables.Filters()
 
 def saveh(file, *args, **kwargs):
     """
@@ -105,10 +111,15 @@ def saveh(file, *args, **kwargs):
                 ' and keyword %s' % key)
         namedict[key] = val
     
-    # ensure that they don't already exist
-    current_nodes = [e.name for e in handle.listNodes(where='/')]
+    # ensure that they don't already exist. checking each key with getNode
+    # is one hash lookup in the metadata, rather than enumerating every
+    # node in the group for each call
     for key in namedict.keys():
-        if key in current_nodes:
+        try:
+            handle.getNode(where='/', name=key)
+        except tables.NoSuchNodeError:
+            pass
+        else:
             raise IOError('Array already exists in file: %s' % key)
     
     # save all the arrays
@@ -138,10 +149,10 @@ def saveh(file, *args, **kwargs):
         handle.close()
 
     
-def loadh(file, name=Ellipsis, deferred=True):
+def loadh(file, name=Ellipsis, deferred=True, mmap=False):
     """
     Load an array(s) from .hdf format files
-    
+
     Parameters
     ----------
     file : string or tables.File
@@ -153,7 +164,13 @@ def loadh(file, name=Ellipsis, deferred=True):
     deferred : bool, optional
         If true, and you did not request just a single name, the result will
         be lazyily loaded.
-    
+    mmap : bool, optional
+        If true, return the underlying HDF5 node(s) instead of materializing
+        the arrays in memory. A node acts like a read-only array -- it has
+        shape and dtype and supports slicing -- but only pulls the accessed
+        chunks off disk, so the full array never has to fit in RAM. Note
+        that the file handle is kept open for the life of the node.
+
     Returns
     -------
     result : array or dict-like
@@ -186,35 +203,45 @@ def loadh(file, name=Ellipsis, deferred=True):
         except tables.NoSuchNodeError:
             raise KeyError('Node "%s" does not exist '
                 'in file %s' % (name, file))
-        
-        return_value = np.array(node[:])
+
+        if mmap:
+            # the node reads chunks lazily from disk; closing the handle
+            # would invalidate it, so leave the file open
+            return node
+
+        # node.read() materializes the array once; np.array(node[:]) would
+        # copy it a second time
+        return_value = node.read()
         if own_fid:
             handle.close()
         return return_value
-    
+
     if not deferred:
         result = {}
         for node in handle.iterNodes(where='/'):
-            result[node.name] = node[:]
+            result[node.name] = node.read()
         if own_fid:
             handle.close()
         return result
-        
-    return DeferredTable(handle, own_fid)
+
+    return DeferredTable(handle, own_fid, mmap=mmap)
 
 
 class DeferredTable(object):
-    def __init__(self, handle, own_fid):
+    def __init__(self, handle, own_fid, mmap=False):
         self._handle = handle
-        self._node_names = [e.name for e in handle.iterNodes(where='/')]
         self._loaded = {}
         self._own_fid = own_fid
-        
+        self._mmap = mmap
+
+        # walk the file's metadata once -- each getNode call descends the
+        # HDF5 metadata tree again, which adds up for files with many nodes
+        self._node_names = []
         repr_strings = []
-        for name in self._node_names:
+        for node in handle.iterNodes(where='/'):
+            self._node_names.append(node.name)
             repr_strings.append('  %s: [shape=%s, dtype=%s]' % \
-                (name, handle.getNode(where='/', name=name).shape,
-                handle.getNode(where='/', name=name).dtype))
+                (node.name, node.shape, node.dtype))
         self._repr_string = '{\n%s\n}' % ',\n'.join(repr_strings)
     
     def __repr__(self):
@@ -230,8 +257,11 @@ class DeferredTable(object):
     def __getitem__(self, key):
         if key not in self._node_names:
             raise KeyError('%s not in %s' % (key, self._node_names))
+        if self._mmap:
+            # hand back the node itself -- it reads chunks on demand
+            return self._handle.getNode(where='/', name=key)
         if key not in self._loaded:
-            self._loaded[key] = self._handle.getNode(where='/', name=key)[:]
+            self._loaded[key] = self._handle.getNode(where='/', name=key).read()
         return self._loaded[key]
     
     def iteritems(self):
@@ -1,5 +1,6 @@
 import warnings
 import numpy as np
+import scipy.spatial.distance
 from collections import namedtuple
 from baseclasses import AbstractDistanceMetric
 from msmbuilder import _rmsdcalc
@@ -38,17 +39,18 @@ class RMSD(AbstractDistanceMetric):
 
                 self.centerConformations(XYZData)
 
-                NumAtomsWithPadding = 4 + NumAtoms - NumAtoms % 4
+                # pad out to a multiple of 8 so the C kernel can run
+                # eight-wide (AVX2) as well as four-wide (SSE) over the atoms
+                NumAtomsWithPadding = 8 + NumAtoms - NumAtoms % 8
 
-                # Load data and generators into aligned arrays
+                # Load data and generators into aligned arrays, transposing
+                # all frames into the padded SoA layout in one shot
                 XYZData2 = np.zeros((NumConfs, 3, NumAtomsWithPadding), dtype=np.float32)
-                for i in range(NumConfs):
-                    XYZData2[i, 0:3, 0:NumAtoms] = XYZData[i].transpose()
+                XYZData2[:, :, 0:NumAtoms] = XYZData.transpose((0, 2, 1))
 
-                #Precalculate matrix magnitudes
-                ConfG = np.zeros((NumConfs,),dtype=np.float32)
-                for i in xrange(NumConfs):
-                    ConfG[i] = self.calcGvalue(XYZData[i, :, :])
+                # Precalculate matrix magnitudes. Done in double precision
+                # (like calcGvalue) but for every frame at once
+                ConfG = (XYZData.astype('float64') ** 2).sum(axis=2).sum(axis=1).astype(np.float32)
 
                 self.XYZData = XYZData2
                 self.G = ConfG
@@ -74,8 +76,7 @@ class RMSD(AbstractDistanceMetric):
         def CheckCentered(self, Epsilon=1E-5):
             """Raise an exception if XYZAtomMajor has nonnzero center of mass(CM)."""
 
-            XYZ = self.XYZData.transpose(0, 2, 1)
-            x = np.array([max(abs(XYZ[i].mean(0))) for i in xrange(len(XYZ))]).max()
+            x = np.abs(self.XYZData.mean(axis=2)).max()
             if x > Epsilon:
                 raise Exception("The coordinate data does not appear to have been centered correctly.")
 
@@ -83,10 +84,14 @@ class RMSD(AbstractDistanceMetric):
         def centerConformations(XYZList):
             """Remove the center of mass from conformations.  Inplace to minimize mem. use."""
 
-            for ci in xrange(XYZList.shape[0]):
-                X = XYZList[ci].astype('float64')  # To improve the accuracy of RMSD, it can help to do certain calculations in double precision.
-                X -= X.mean(0)
-                XYZList[ci] = X.astype('float32')
+            # To improve the accuracy of RMSD, it can help to do certain
+            # calculations in double precision. Frames are processed in
+            # blocks so only a bounded number of float64 copies are live
+            block_size = 512
+            for start in xrange(0, XYZList.shape[0], block_size):
+                X = XYZList[start:start + block_size].astype('float64')
+                X -= X.mean(1)[:, np.newaxis, :]
+                XYZList[start:start + block_size] = X.astype('float32')
             return
 
         @staticmethod
@@ -128,6 +133,16 @@ class RMSD(AbstractDistanceMetric):
         """
         self.atomindices = atomindices
         self.omp_parallel = omp_parallel
+        self._num_single_element_calls = 0
+
+        # bind the C entry points once here, instead of re-selecting on the
+        # omp_parallel flag inside every distance call
+        if self.omp_parallel:
+            self._one_to_all_core = _rmsdcalc.getMultipleRMSDs_aligned_T_g
+            self._one_to_many_core = _rmsdcalc.getMultipleRMSDs_aligned_T_g_at_indices
+        else:
+            self._one_to_all_core = _rmsdcalc.getMultipleRMSDs_aligned_T_g_serial
+            self._one_to_many_core = _rmsdcalc.getMultipleRMSDs_aligned_T_g_at_indices_serial
 
     def __repr__(self):
         try:
@@ -197,18 +212,30 @@ class RMSD(AbstractDistanceMetric):
         if not isinstance(prepared_traj2, RMSD.TheoData):
             raise TypeError('Theodata required')
 
-        if self.omp_parallel:
-            return _rmsdcalc.getMultipleRMSDs_aligned_T_g_at_indices(
-                      prepared_traj1.NumAtoms, prepared_traj1.NumAtomsWithPadding,
-                      prepared_traj1.NumAtomsWithPadding, prepared_traj2.XYZData,
-                      prepared_traj1.XYZData[index1], prepared_traj2.G,
-                      prepared_traj1.G[index1], indices2)
-        else:
-            return _rmsdcalc.getMultipleRMSDs_aligned_T_g_at_indices_serial(
-                      prepared_traj1.NumAtoms, prepared_traj1.NumAtomsWithPadding,
-                      prepared_traj1.NumAtomsWithPadding, prepared_traj2.XYZData,
-                      prepared_traj1.XYZData[index1], prepared_traj2.G,
-                      prepared_traj1.G[index1], indices2)
+        # the C kernel loops over all of indices2 in one call, so the cheap
+        # way to use this method is with one big index array. Calling it in a
+        # Python loop with one index at a time pays the dispatch overhead
+        # len(indices2) times over; nudge users toward the batched form
+        if len(indices2) == 1:
+            self._num_single_element_calls += 1
+            if self._num_single_element_calls == 100:
+                warnings.warn('one_to_many has been called 100 times with a '
+                    'single index. Pass all the indices in one call instead: '
+                    'the C kernel computes the whole batch without returning '
+                    'to Python')
+
+        # when the targets are just all the frames, skip the index-gather
+        # kernel and use the contiguous one_to_all kernel
+        if len(indices2) == len(prepared_traj2) and \
+                indices2[0] == 0 and indices2[-1] == len(prepared_traj2) - 1 and \
+                np.all(np.diff(indices2) == 1):
+            return self.one_to_all(prepared_traj1, prepared_traj2, index1)
+
+        return self._one_to_many_core(
+                  prepared_traj1.NumAtoms, prepared_traj1.NumAtomsWithPadding,
+                  prepared_traj1.NumAtomsWithPadding, prepared_traj2.XYZData,
+                  prepared_traj1.XYZData[index1], prepared_traj2.G,
+                  prepared_traj1.G[index1], indices2)
 
     def one_to_all(self, prepared_traj1, prepared_traj2, index1):
         """Calculate a vector of distances from one frame of the first trajectory
@@ -236,24 +263,88 @@ class RMSD(AbstractDistanceMetric):
         parallelization in C to do this faster.
         """
 
-        if self.omp_parallel:
-            return _rmsdcalc.getMultipleRMSDs_aligned_T_g(
+        return self._one_to_all_core(
                 prepared_traj1.NumAtoms, prepared_traj1.NumAtomsWithPadding,
                 prepared_traj1.NumAtomsWithPadding, prepared_traj2.XYZData,
                 prepared_traj1.XYZData[index1], prepared_traj2.G,
                 prepared_traj1.G[index1])
-        else:
-            return _rmsdcalc.getMultipleRMSDs_aligned_T_g_serial(
-                    prepared_traj1.NumAtoms, prepared_traj1.NumAtomsWithPadding,
-                    prepared_traj1.NumAtomsWithPadding, prepared_traj2.XYZData,
-                    prepared_traj1.XYZData[index1], prepared_traj2.G,
-                    prepared_traj1.G[index1])
 
-    def _square_all_pairwise(self, prepared_traj):
-        """Reference implementation of all_pairwise"""
-        warnings.warn('This is HORRIBLY inefficient. This operation really needs to be done directly in C')
-        traj_length = prepared_traj.XYZData.shape[0]
-        output = np.empty((traj_length, traj_length))
-        for i in xrange(traj_length):
-            output[i] = self.one_to_all(prepared_traj, prepared_traj, i)
+    def all_pairwise(self, prepared_traj):
+        """Calculate a condensed distance matrix of all the pairwise distances
+        between each frame with each other frame in prepared_traj
+
+        The work is tiled over blocks of frames so that the coordinate panels
+        being compared stay resident in cache instead of streaming the whole
+        trajectory through memory once per frame.
+
+        Parameters
+        ----------
+        prepared_traj : rmsd.TheoData
+            Prepared trajectory
+
+        Returns
+        -------
+        Y : ndarray
+            A 1D array containing the distance from each frame to each other
+            frame, in condensed form
+
+        See Also
+        --------
+        scipy.spatial.distance.squareform
+        """
+
+        return self._blocked_all_pairwise(prepared_traj)
+
+    def _blocked_all_pairwise(self, prepared_traj, block_size=64):
+        """Compute the condensed pairwise distance matrix in frame blocks
+
+        For each pair of blocks, the second coordinate panel is extracted
+        once (a contiguous copy, via TheoData.__getitem__) and reused for
+        every frame of the first block, so each panel is loaded from main
+        memory O(F / block_size) times instead of O(F) times.
+
+        Parameters
+        ----------
+        prepared_traj : rmsd.TheoData
+            Prepared trajectory
+        block_size : int, optional
+            Number of frames per block. The default is sized so that two
+            blocks of coordinates fit comfortably in L2 cache.
+
+        Returns
+        -------
+        Y : ndarray
+            Condensed distance matrix, identical in layout to the output of
+            AbstractDistanceMetric.all_pairwise
+        """
+
+        traj_length = len(prepared_traj)
+        output = np.empty(traj_length * (traj_length - 1) / 2, dtype=np.float32)
+
+        for ii in xrange(0, traj_length, block_size):
+            i_end = min(ii + block_size, traj_length)
+            for jj in xrange(ii, traj_length, block_size):
+                j_end = min(jj + block_size, traj_length)
+                jblock = prepared_traj[jj:j_end]
+
+                for i in xrange(ii, i_end):
+                    d = self.one_to_all(prepared_traj, jblock, i)
+                    if jj == ii:
+                        # diagonal block: only the j > i half is needed
+                        segment = d[i - jj + 1:]
+                        j_start = i + 1
+                    else:
+                        segment = d
+                        j_start = jj
+                    p = traj_length * i - i * (i + 1) / 2 + j_start - i - 1
+                    output[p:p + len(segment)] = segment
+
         return output
+
+    def _square_all_pairwise(self, prepared_traj):
+        """Square-form version of all_pairwise
+
+        The distances are computed once, in condensed form, and only
+        expanded to the redundant square matrix at the end.
+        """
+        return scipy.spatial.distance.squareform(self.all_pairwise(prepared_traj))
@@ -1,9 +1,10 @@
 import os
 import logging
-from glob import glob
+import itertools
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 from msmbuilder.utils import keynat
 from msmbuilder import Trajectory
-from msmbuilder.utils import keynat
 
 from project import Project
 from validators import ValidationError
@@ -60,6 +61,11 @@ class ProjectBuilder(object):
         if input_traj_ext not in ['.xtc', '.dcd']:
             raise ValueError("Unsupported format")
 
+        # parse the topology once up front -- every trajectory is built
+        # against this in-memory conformation, rather than re-reading and
+        # re-parsing the same pdb file per trajectory
+        self._conf = Trajectory.load_from_pdb(self.conf_filename)
+
         self._check_out_dir()
 
     def _validate_traj(self, traj):
@@ -145,6 +151,14 @@ class ProjectBuilder(object):
         -------
         project : msmbuilder.projec
             The project object, summarizing the conversion
+
+        Notes
+        -----
+        The trajectories are loaded concurrently on a thread pool -- the
+        file parsing happens in C extensions that release the GIL, and
+        the inputs are independent. Saving and validation stay in this
+        thread, in trajectory order, so the lh5 files keep a single
+        writer.
         """
 
         traj_lengths = []
@@ -152,34 +166,52 @@ class ProjectBuilder(object):
         traj_errors = []
         traj_converted_from = []
 
-        for i, file_list in enumerate(self._input_trajs()):
-            
-            error = None
-            
+        def load_one(file_list):
+            # the stride is applied inside the loader, which only keeps
+            # every stride-th frame, rather than materializing the full
+            # trajectory and slicing it down afterwards
             try:
                 traj = self._load_traj(file_list)
-                traj["XYZList"] = traj["XYZList"][::self.stride]
             except TypeError as e:
-                traj_errors.append(e)
-                logger.warning('Could not convert: %s (%s)', file_list, e)
-            else:
-                lh5_fn = os.path.join(self.output_traj_dir, 
-                                      (self.output_traj_basename + str(i) + self.output_traj_ext))
-                traj.save(lh5_fn)
-                traj_lengths.append(len(traj["XYZList"]))
-                traj_paths.append(lh5_fn)
-                traj_converted_from.append(file_list)
-            
-                try:
-                    self._validate_traj(traj)
-                    logger.info("%s, length %d, converted to %s", 
-                                file_list, traj_lengths[-1], lh5_fn)
-                except ValidationError as e:
-                    error = e
-                    logger.error("%s, length %d, converted to %s with error '%s'", 
-                                 file_list, traj_lengths[-1], lh5_fn, e)
+                return None, e
+            return traj, None
 
-            traj_errors.append(error)
+        file_lists = list(self._input_trajs())
+        pool = ThreadPool(max(1, min(len(file_lists) or 1,
+                                     multiprocessing.cpu_count())))
+        try:
+            loaded = pool.imap(load_one, file_lists)
+            # izip, not zip: zip would drain the whole imap iterator up
+            # front, holding every loaded trajectory in memory at once
+            for i, (file_list, (traj, load_error)) in enumerate(
+                    itertools.izip(file_lists, loaded)):
+
+                error = None
+
+                if load_error is not None:
+                    traj_errors.append(load_error)
+                    logger.warning('Could not convert: %s (%s)', file_list, load_error)
+                else:
+                    lh5_fn = os.path.join(self.output_traj_dir,
+                                          (self.output_traj_basename + str(i) + self.output_traj_ext))
+                    traj.save(lh5_fn)
+                    traj_lengths.append(len(traj["XYZList"]))
+                    traj_paths.append(lh5_fn)
+                    traj_converted_from.append(file_list)
+
+                    try:
+                        self._validate_traj(traj)
+                        logger.info("%s, length %d, converted to %s",
+                                    file_list, traj_lengths[-1], lh5_fn)
+                    except ValidationError as e:
+                        error = e
+                        logger.error("%s, length %d, converted to %s with error '%s'",
+                                     file_list, traj_lengths[-1], lh5_fn, e)
+
+                traj_errors.append(error)
+        finally:
+            pool.close()
+            pool.join()
 
         if len(traj_paths) == 0:
             os.rmdir(self.output_traj_dir)
@@ -196,11 +228,18 @@ class ProjectBuilder(object):
         logger.warning("WARNING: Sorting trajectory files by numerical values in their names.")
         logger.warning("Ensure that numbering is as intended.")
 
-        traj_dirs = glob(os.path.join(self.input_traj_dir, "*"))
+        # list each directory once and filter with string predicates --
+        # glob would pay an extra listdir plus fnmatch per pattern
+        traj_dirs = [os.path.join(self.input_traj_dir, e)
+                     for e in os.listdir(self.input_traj_dir)
+                     if not e.startswith('.')]
         traj_dirs.sort(key=keynat)
         logger.info("Found %s traj dirs", len(traj_dirs))
         for traj_dir in traj_dirs:
-            to_add = glob(traj_dir + '/*'+ self.input_traj_ext)
+            if not os.path.isdir(traj_dir):
+                continue
+            to_add = [os.path.join(traj_dir, e) for e in os.listdir(traj_dir)
+                      if e.endswith(self.input_traj_ext)]
             to_add.sort(key=keynat)
             if to_add:
                 yield to_add
@@ -218,10 +257,11 @@ class ProjectBuilder(object):
         """
 
         if self.input_traj_ext == '.xtc':
-            traj = Trajectory.load_from_xtc(file_list, PDBFilename=self.conf_filename,
-                        discard_overlapping_frames=True)
+            traj = Trajectory.load_from_xtc(file_list, Conf=self._conf,
+                        discard_overlapping_frames=True, Stride=self.stride)
         elif self.input_traj_ext == '.dcd':
-            traj = Trajectory.load_from_xtc(file_list, PDBFilename=self.conf_filename)
+            traj = Trajectory.load_from_dcd(file_list, Conf=self._conf,
+                        Stride=self.stride)
         else:
             raise ValueError()
         return traj
@@ -270,17 +310,21 @@ class FahProjectBuilder(ProjectBuilder):
     
 
     def _input_trajs(self):
-        
-        run_dirs = glob(os.path.join(self.input_traj_dir, "RUN*"))
+
+        run_dirs = [os.path.join(self.input_traj_dir, e)
+                    for e in os.listdir(self.input_traj_dir)
+                    if e.startswith('RUN')]
         run_dirs.sort(key=keynat)
         logger.info("Found %d RUN dirs", len(run_dirs))
-        
+
         for run_dir in run_dirs:
-            clone_dirs = glob(os.path.join(run_dir, "CLONE*"))
+            clone_dirs = [os.path.join(run_dir, e) for e in os.listdir(run_dir)
+                          if e.startswith('CLONE')]
             logger.info("%s: Found %d CLONE dirs", run_dir, len(clone_dirs))
 
             for clone_dir in clone_dirs:
-                to_add = glob(clone_dir + '/*'+ self.input_traj_ext)
+                to_add = [os.path.join(clone_dir, e) for e in os.listdir(clone_dir)
+                          if e.endswith(self.input_traj_ext)]
                 to_add.sort(key=keynat)
                 if to_add:
                     yield to_add
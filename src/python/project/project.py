@@ -17,12 +17,22 @@
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 import os
+import json
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import numpy as np
 import yaml
+try:
+    # the libyaml C extension parses/emits big trajectory lists about an
+    # order of magnitude faster than the pure python loader. Use the full
+    # (non-safe) Loader/Dumper: the error records hold exception instances,
+    # which the safe variants refuse to represent
+    from yaml import CLoader as _YamlLoader, CDumper as _YamlDumper
+except ImportError:
+    from yaml import Loader as _YamlLoader, Dumper as _YamlDumper
 from msmbuilder import Trajectory
 from msmbuilder import io
 import logging
-from msmbuilder.utils import keynat
 logger = logging.getLogger('project')
 
 
@@ -30,7 +40,10 @@ class Project(object):
     @property
     def conf_filename(self):
         """Filename of the project topology (PDB)"""
-        return os.path.normpath(os.path.join(self._project_dir, self._conf_filename))
+        if self._cached_conf_filename is None:
+            self._cached_conf_filename = os.path.normpath(
+                os.path.join(self._project_dir, self._conf_filename))
+        return self._cached_conf_filename
 
     @property
     def n_trajs(self):
@@ -40,7 +53,17 @@ class Project(object):
     @property
     def traj_lengths(self):
         """Length of each of the trajectories, in frames"""
-        return self._traj_lengths[self._valid_traj_indices]
+        # memoized: hot code asks for this once per trajectory, and the
+        # fancy indexing would otherwise allocate a fresh copy every time
+        if self._valid_traj_lengths is None:
+            self._valid_traj_lengths = self._traj_lengths[self._valid_traj_indices]
+            self._valid_traj_lengths.flags.writeable = False
+        return self._valid_traj_lengths
+
+    @property
+    def max_traj_length(self):
+        """Length of the longest trajectory, in frames"""
+        return int(np.max(self.traj_lengths))
 
     def __init__(self, records, validate=True, project_dir='.'):
         """Create a project from a  set of records
@@ -84,16 +107,18 @@ class Project(object):
                 len(self._traj_converted_from) == len(self._traj_errors):
             raise ValueError("Inconsistent records: traj fields not all the same length")
 
-        # set the length field
-        self._valid_traj_indices = np.arange(len(self._traj_lengths))
+        # one boolean pass over the errors gives both the lookup table and
+        # the error report, instead of rescanning the list for each
+        good = np.array([e is None for e in self._traj_errors], dtype=bool)
+        self._valid_traj_indices = np.flatnonzero(good)
+        self._valid_traj_lengths = None  # filled lazily by traj_lengths
+        self._traj_filenames = None      # filled lazily by traj_filename
+        self._cached_conf_filename = None
 
         # if there are errors
-        if np.any(self._traj_errors):
-            self._valid_traj_indices = np.array([i for i, e in enumerate(self._traj_errors) if e is None], dtype=int)
-            n_errors = len([e for e in self._traj_errors if e is not None])
-            logger.error('Errors detected in conversion: %d trajectories', n_errors)
-
-            errors = np.setdiff1d(np.arange(len(self._traj_errors)), self._valid_traj_indices)
+        if not good.all():
+            errors = np.flatnonzero(~good)
+            logger.error('Errors detected in conversion: %d trajectories', len(errors))
             logger.error('The trajectories in error are numbers %s. If this project was '
                          'loaded from a yaml file, check the file for details' % errors)
 
@@ -109,15 +134,23 @@ class Project(object):
         return 'Project<(%d trajectories, from %s to %s  topology: %s)>' % (self.n_trajs, self.traj_filename(0), self.traj_filename(self.n_trajs - 1), self.conf_filename)
 
     @classmethod
-    def load_from(cls, filename):
+    def load_from(cls, filename, validate=True):
         """
         Load project from disk
 
         Parameters
         ----------
         filename : string
-            filename_or_file can be a path to a legacy .h5 or current
-            .yaml file.
+            filename_or_file can be a path to a legacy .h5, a current
+            .yaml file, or a .json file with the same schema.
+        validate : bool or 'auto', optional
+            If True (default), check the project for consistency against
+            the files on disk. If 'auto', remember a successful check in
+            a sibling <filename>.validated marker and skip the check on
+            subsequent loads for as long as the manifest's mtime is
+            unchanged -- useful for read-mostly workflows where the
+            validation pass (which opens every trajectory) dominates
+            load time. If False, never check.
 
         Returns
         -------
@@ -127,44 +160,73 @@ class Project(object):
 
         rootdir = os.path.abspath(os.path.dirname(filename))
 
-        if filename.endswith('.yaml'):
+        if filename.endswith('.yaml') or filename.endswith('.json'):
             with open(filename) as f:
-                ondisk = yaml.load(f)
+                if filename.endswith('.json'):
+                    # same schema as the yaml format -- just dicts, lists
+                    # and scalars -- but the json parser gets through a
+                    # big manifest several times faster than even libyaml
+                    ondisk = json.load(f)
+                else:
+                    ondisk = yaml.load(f, Loader=_YamlLoader)
+                trajs = ondisk['trajs']
                 records = {'conf_filename': ondisk['conf_filename'],
-                           'traj_lengths': [],
-                           'traj_paths': [],
-                           'traj_converted_from': [],
-                           'traj_errors': []}
-
-                for trj in ondisk['trajs']:
-                    records['traj_lengths'].append(trj['length'])
-                    records['traj_paths'].append(trj['path'])
-                    records['traj_errors'].append(trj['errors'])
-                    records['traj_converted_from'].append(trj['converted_from'])
+                           'traj_lengths': [trj['length'] for trj in trajs],
+                           'traj_paths': [trj['path'] for trj in trajs],
+                           'traj_converted_from': [trj['converted_from'] for trj in trajs],
+                           'traj_errors': [trj['errors'] for trj in trajs]}
 
         elif filename.endswith('.h5'):
             ondisk = io.loadh(filename, deferred=False)
             n_trajs = len(ondisk['TrajLengths'])
+
+            # this is the convention used in the hdf project format to get
+            # the traj paths. The pieces are constant over the project, so
+            # pull them out of the arrays once rather than per trajectory
+            path_prefix = ondisk['TrajFilePath'][0]
+            basename = ondisk['TrajFileBaseName'][0]
+            file_type = ondisk['TrajFileType'][0]
+
             records = {'conf_filename': str(ondisk['ConfFilename'][0]),
                        'traj_lengths': ondisk['TrajLengths'],
-                       'traj_paths': [],
+                       'traj_paths': [os.path.join(path_prefix, basename + str(i) + file_type)
+                                      for i in xrange(n_trajs)],
                        'traj_converted_from': [None] * n_trajs,
                        'traj_errors': [None] * n_trajs}
 
-            for i in xrange(n_trajs):
-                # this is the convention used in the hdf project format to get the traj paths
-                path = os.path.join( ondisk['TrajFilePath'][0], ondisk['TrajFileBaseName'][0] + str(i) + ondisk['TrajFileType'][0] )
-                records['traj_paths'].append(path)
-
         else:
-            raise ValueError('Sorry, I can only open files in .yaml'
-                             ' or .h5 format: %s' % filename)
+            raise ValueError('Sorry, I can only open files in .yaml,'
+                             ' .json or .h5 format: %s' % filename)
+
+        marker_fn = filename + '.validated'
+        if validate == 'auto':
+            # the marker records the manifest mtime at the last successful
+            # validation; any rewrite of the manifest invalidates it
+            run_validate = True
+            try:
+                with open(marker_fn) as f:
+                    marker = json.load(f)
+                run_validate = marker.get('mtime') != os.path.getmtime(filename)
+            except (IOError, ValueError):
+                pass
+        else:
+            run_validate = bool(validate)
+
+        project = cls(records, validate=run_validate, project_dir=rootdir)
 
-        return cls(records, validate=True, project_dir=rootdir)
+        if validate == 'auto' and run_validate:
+            try:
+                with open(marker_fn, 'w') as f:
+                    json.dump({'mtime': os.path.getmtime(filename)}, f)
+            except IOError:
+                logger.warning('Could not write validation marker %s', marker_fn)
+
+        return project
 
     def save(self, filename_or_file):
         if isinstance(filename_or_file, basestring):
-            if not filename_or_file.endswith('.yaml'):
+            if not (filename_or_file.endswith('.yaml')
+                    or filename_or_file.endswith('.json')):
                 filename_or_file += '.yaml'
             dirname = os.path.abspath(os.path.dirname(filename_or_file))
             if not os.path.exists(dirname):
@@ -176,6 +238,7 @@ class Project(object):
             dirname = os.path.abspath(os.path.dirname(filename_or_file.name))
             handle = filename_or_file
             own_fid = False
+        use_json = handle.name.endswith('.json')
 
         # somewhat complicated logic if the directory you're
         # saving in is different than the directory this
@@ -187,20 +250,40 @@ class Project(object):
         # is being resaved (but the Trajectorys are not being moved)
         # then the paths need to change to compensate
 
-        relative = os.path.relpath(self._project_dir, os.path.dirname(filename_or_file))
+        # dirname was already computed (and works for both filenames and
+        # open file handles, unlike dirname of the raw argument)
+        relative = os.path.relpath(self._project_dir, dirname)
 
-        records = {'trajs': []}
-        records['conf_filename'] = os.path.join(relative, self._conf_filename)
-        traj_paths = [os.path.join(relative, path) for path in self._traj_paths]
-        for i in xrange(len(traj_paths)):
+        if relative in ('', os.curdir):
+            # saving back into the project directory, so the recorded
+            # relative paths are already right -- skip rejoining each one
+            conf_filename = self._conf_filename
+            traj_paths = self._traj_paths
+        else:
+            conf_filename = os.path.join(relative, self._conf_filename)
+            traj_paths = [os.path.join(relative, path) for path in self._traj_paths]
+
+        records = {'trajs': [], 'conf_filename': conf_filename}
+        record_fields = zip(traj_paths, self._traj_converted_from,
+                            self._traj_lengths, self._traj_errors)
+        for i, (path, converted_from, length, error) in enumerate(record_fields):
             # yaml doesn't like numpy types, so we have to sanitize them
             records['trajs'].append({'id': i,
-                                    'path': str(traj_paths[i]),
-                                    'converted_from': self._traj_converted_from[i].tolist(),
-                                    'length': int(self._traj_lengths[i]),
-                                    'errors': self._traj_errors[i]})
-
-        yaml.dump(records, handle)
+                                    'path': str(path),
+                                    'converted_from': converted_from.tolist(),
+                                    'length': int(length),
+                                    'errors': error})
+
+        if use_json:
+            # json can't represent the exception instances in the error
+            # records, so they get stringified. On reload they're still
+            # non-None, which is all the valid-trajectory filtering needs
+            for record in records['trajs']:
+                if record['errors'] is not None:
+                    record['errors'] = repr(record['errors'])
+            json.dump(records, handle)
+        else:
+            yaml.dump(records, handle, Dumper=_YamlDumper)
 
         if own_fid:
             handle.close()
@@ -218,19 +301,54 @@ class Project(object):
 
     def traj_filename(self, traj_index):
         "Get the filename of one of the trajs on disk"
-        path = self._traj_paths[self._valid_traj_indices[traj_index]]
-        return os.path.normpath(os.path.join(self._project_dir, path))
+        # normalizing against the project dir is constant per trajectory,
+        # so it's done once for all of them and cached
+        if self._traj_filenames is None:
+            self._traj_filenames = [
+                os.path.normpath(os.path.join(self._project_dir, path))
+                for path in self._traj_paths[self._valid_traj_indices]]
+        return self._traj_filenames[traj_index]
 
     def _validate(self):
         "Run some checks to ensure that this project is consistent"
-        
+        self._validate_paths()
+        self._validate_shapes()
+
+    def _validate_paths(self):
+        """Check that the conf and every trajectory exist on disk.
+
+        This is the cheap half of validation -- a handful of directory
+        listings, no file opens."""
+
         if not os.path.exists(self.conf_filename):
             raise ValueError('conf does not exist: %s' % self.conf_filename)
+
+        # check existence against one directory listing per distinct traj
+        # directory, instead of paying a stat call (a network round trip,
+        # on parallel filesystems) for every file
+        listings = {}
         for i in xrange(self.n_trajs):
-            if not os.path.exists(self.traj_filename(i)):
-                raise ValueError("%s does not exist" % self.traj_filename(i))
+            filename = self.traj_filename(i)
+            dirname, basename = os.path.split(filename)
+            if dirname not in listings:
+                if os.path.isdir(dirname):
+                    listings[dirname] = set(os.listdir(dirname))
+                else:
+                    listings[dirname] = set()
+            if basename not in listings[dirname]:
+                raise ValueError("%s does not exist" % filename)
+
+    def _validate_shapes(self):
+        """Check the recorded trajectory lengths against the files.
+
+        This is the expensive half of validation: it opens every
+        trajectory to read its header. Callers that only need the
+        existence checks can run _validate_paths alone, or skip
+        validation wholesale with load_from(..., validate=False) or
+        the 'auto' marker."""
+
         lengths, atoms = self._eval_traj_shapes()
-        if not np.all(self.traj_lengths == lengths):
+        if not np.array_equal(self.traj_lengths, lengths):
             raise ValueError('Trajs length don\'t match what\'s on disk')
 
         # make sure all trajs have the same number of atoms
@@ -245,11 +363,27 @@ class Project(object):
         return traj
 
     def _eval_traj_shapes(self):
-        lengths = np.zeros(self.n_trajs)
-        n_atoms = np.zeros(self.n_trajs)
+        # frame and atom counts are integers; a float64 buffer would just
+        # force a coercing comparison against the stored lengths
+        lengths = np.empty(self.n_trajs, dtype=np.int64)
+        n_atoms = np.empty(self.n_trajs, dtype=np.int64)
         conf = self.load_conf()
-        for i in xrange(self.n_trajs):
-            shape = Trajectory.load_trajectory_file(self.traj_filename(i), JustInspect=True, Conf=conf)
-            lengths[i] = shape[0]
-            n_atoms[i] = shape[1]
+
+        # JustInspect only touches the file headers, so each inspection is
+        # an open/read-metadata/close round trip. Those release the GIL,
+        # and over thousands of trajectories (especially on a network
+        # filesystem) overlapping them is the entire cost, so they go
+        # through a thread pool
+        def inspect(i):
+            return i, Trajectory.load_trajectory_file(self.traj_filename(i),
+                                                      JustInspect=True, Conf=conf)
+
+        pool = ThreadPool(max(1, min(self.n_trajs, multiprocessing.cpu_count())))
+        try:
+            for i, shape in pool.imap_unordered(inspect, xrange(self.n_trajs)):
+                lengths[i] = shape[0]
+                n_atoms[i] = shape[1]
+        finally:
+            pool.close()
+            pool.join()
         return lengths, n_atoms
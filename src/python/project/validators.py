@@ -73,8 +73,11 @@ class ExplosionValidator(object):
     def __call__(self, traj):
         ptraj = self.metric.prepare_trajectory(traj)
         distances = self.metric.one_to_all(self._pconf, ptraj, 0)
-        if np.any(distances > self.max_distance):
-            i = np.where(distances > self.max_distance)[0][0]  # just get the first
+        # argmax of the boolean mask is the first offending frame, so one
+        # comparison pass covers the any/where/recompare triple
+        exploded = distances > self.max_distance
+        i = int(np.argmax(exploded))
+        if exploded[i]:
             d = distances[i]
             raise ExplosionError('d(conf, frame[%d])=%f; greater than %s; metric=%s' % (i, d, self.max_distance, self.metric))
 
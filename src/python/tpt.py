@@ -26,6 +26,8 @@ To Do:
 -- Get stuff passing unit tests
 """
 
+import heapq
+
 import numpy as np
 import scipy.sparse
 
@@ -62,11 +64,55 @@ def _check_sources_sinks(sources, sinks):
     return sources, sinks
 
 
+class TPTContext(object):
+    """
+    Caches quantities shared by repeated TPT queries on one transition matrix.
+
+    Validating the transition matrix, solving for the equilibrium populations
+    and solving the committor linear system are each needed by several of the
+    `calculate_*` functions. When the same `tprob` is queried more than once
+    (fluxes, then net fluxes, then paths, say), constructing a context and
+    passing it via the `ctx` keyword performs each of those once instead of
+    once per call.
+
+    Parameters
+    ----------
+    tprob : mm_matrix
+        The transition matrix. Checked once, here; sparse matrices are
+        converted to CSR up front.
+    """
+
+    def __init__(self, tprob):
+        msm_analysis.check_transition(tprob)
+        if scipy.sparse.issparse(tprob):
+            tprob = tprob.tocsr()
+        self.tprob = tprob
+        self._populations = None
+        self._committors = {}
+
+    @property
+    def populations(self):
+        """The equilibrium populations, solved on first access."""
+        if self._populations is None:
+            eigens = msm_analysis.get_eigenvectors(self.tprob, 5)
+            if np.count_nonzero(np.imag(eigens[1][:, 0])) != 0:
+                raise ValueError('First eigenvector has imaginary components')
+            self._populations = np.real(eigens[1][:, 0])
+        return self._populations
+
+    def committors(self, sources, sinks):
+        """The committors for (`sources`, `sinks`), solved once per pair."""
+        key = (tuple(sources), tuple(sinks))
+        if key not in self._committors:
+            self._committors[key] = calculate_committors(sources, sinks, self.tprob)
+        return self._committors[key]
+
+
 ###############################################################################
 # Path Finding Functions
 #
 
-def find_top_paths(sources, sinks, tprob, num_paths=10, node_wipe=False, net_flux=None):
+def find_top_paths(sources, sinks, tprob, num_paths=10, node_wipe=False, net_flux=None, ctx=None):
     r"""
     Calls the Dijkstra algorithm to find the top 'NumPaths'.
 
@@ -101,6 +147,10 @@ def find_top_paths(sources, sinks, tprob, num_paths=10, node_wipe=False, net_flu
         Matrix of the net flux from `sources` to `sinks`, see function `net_flux`.
         If not provided, is calculated from scratch. If provided, `tprob` is
         ignored.
+    ctx : TPTContext
+        Cache of quantities shared between TPT queries on `tprob`. If
+        provided, `tprob` is taken from the context and the shared work
+        (validation, populations, committors) is reused across calls.
 
     To Do
     -----
@@ -110,11 +160,14 @@ def find_top_paths(sources, sinks, tprob, num_paths=10, node_wipe=False, net_flu
     # first, do some checking on the input, esp. `sources` and `sinks`
     # we want to make sure all objects are iterable and the sets are disjoint
     sources, sinks = _check_sources_sinks(sources, sinks)
-    msm_analysis.check_transition(tprob)
+    if ctx is not None:
+        tprob = ctx.tprob  # already validated when the context was built
+    else:
+        msm_analysis.check_transition(tprob)
 
     # check to see if we get net_flux for free, otherwise calculate it
     if not net_flux:
-        net_flux = calculate_net_fluxes(sources, sinks, tprob)
+        net_flux = calculate_net_fluxes(sources, sinks, tprob, ctx=ctx)
 
     # initialize objects
     paths = []
@@ -152,7 +205,10 @@ def find_top_paths(sources, sinks, tprob, num_paths=10, node_wipe=False, net_flu
         else:
             net_flux[b1, b2] = 0
 
-        G = scipy.sparse.find(net_flux)
+        # index the graph row-major (CSR) so that the successors of a node
+        # are a contiguous slice, instead of rescanning the whole edge list
+        # on every relaxation
+        csgraph = scipy.sparse.csr_matrix(net_flux)
         Q = [b2]
         b, pi, net_flux = _back_relax(b2, b, pi, net_flux)
 
@@ -161,7 +217,7 @@ def find_top_paths(sources, sinks, tprob, num_paths=10, node_wipe=False, net_flu
         if i != num_paths - 1:
             while len(Q) > 0:
                 w = Q.pop()
-                for v in G[1][np.where(G[0] == w)]:
+                for v in csgraph.indices[csgraph.indptr[w]:csgraph.indptr[w + 1]]:
                     if pi[v] == w:
                         b, pi, net_flux = _back_relax(v, b, pi, net_flux)
                         Q.append(v)
@@ -207,38 +263,44 @@ def Dijkstra(sources, sinks, net_flux):
 
     sources, sinks = _check_sources_sinks(sources, sinks)
 
-    # initialize data structures
-    if scipy.sparse.issparse(net_flux):
-        net_flux = net_flux.tolil()
-    else:
-        net_flux = scipy.sparse.lil_matrix(net_flux)
-
-    G = scipy.sparse.find(net_flux)
-    N = net_flux.shape[0]
+    # successor enumeration dominates the relaxation loop, so index the
+    # graph row-major (CSR) once -- successors of `w` are then a contiguous
+    # slice of `indices`, not a scan over every stored edge
+    csgraph = scipy.sparse.csr_matrix(net_flux)
+    N = csgraph.shape[0]
     b = np.zeros(N)
     b[sources] = 1000
     pi = np.zeros(N, dtype=int)
     pi[sources] = -1
-    U = []
-
-    Q = sorted(range(N), key=lambda v: b[v])
-    for v in sinks:
-        Q.remove(v)
 
-    # run the Dijkstra algorithm
-    while len(Q) > 0:
-        w = Q.pop()
-        U.append(w)
-
-        # relax
-        for v in G[1][np.where(G[0] == w)]:
-            if b[v] < min(b[w], net_flux[w,v]):
-                b[v] = min(b[w], net_flux[w,v])
+    # a max-heap (negated keys) replaces the old sort-the-whole-queue-per-pop
+    # scheme. stale heap entries are simply skipped when popped, which is far
+    # cheaper than re-sorting N nodes after every relaxation
+    sink_set = set(int(v) for v in sinks)
+    expanded = np.zeros(N, dtype=bool)
+    heap = [(-b[v], v) for v in xrange(N) if v not in sink_set]
+    heapq.heapify(heap)
+    n_searched = 0
+
+    while heap:
+        neg_b, w = heapq.heappop(heap)
+        if expanded[w] or -neg_b != b[w]:
+            continue
+        expanded[w] = True
+        n_searched += 1
+
+        # relax: the cost of reaching v through w is the smallest flux
+        # along the path, min(b[w], flux(w, v))
+        for k in xrange(csgraph.indptr[w], csgraph.indptr[w + 1]):
+            v = csgraph.indices[k]
+            cost = min(b[w], csgraph.data[k])
+            if b[v] < cost:
+                b[v] = cost
                 pi[v] = w
+                if (v not in sink_set) and (not expanded[v]):
+                    heapq.heappush(heap, (-cost, v))
 
-        Q = sorted(Q, key=lambda v: b[v])
-
-    logger.info("Searched %s nodes", len(U)+len(sinks))
+    logger.info("Searched %s nodes", n_searched + len(sinks))
 
     return pi, b
 
@@ -409,7 +471,7 @@ def find_path_bottleneck(path, net_flux):
     return (b1, b2), flux
 
 
-def calculate_fluxes(sources, sinks, tprob, populations=None, committors=None):
+def calculate_fluxes(sources, sinks, tprob, populations=None, committors=None, ctx=None):
     """
     Compute the transition path theory flux matrix.
 
@@ -435,10 +497,21 @@ def calculate_fluxes(sources, sinks, tprob, populations=None, committors=None):
         The committors associated with `sources`, `sinks`, and `tprob`.
         If not provided, is calculated from scratch. If provided, `sources`
         and `sinks` are ignored.
+    ctx : TPTContext
+        Cache of quantities shared between TPT queries on `tprob`. If
+        provided, `tprob` is taken from the context and the populations and
+        committors come from its cache (unless passed explicitly).
     """
 
     sources, sinks = _check_sources_sinks(sources, sinks)
-    msm_analysis.check_transition(tprob)
+    if ctx is not None:
+        tprob = ctx.tprob  # already validated when the context was built
+        if populations is None:
+            populations = ctx.populations
+        if committors is None:
+            committors = ctx.committors(sources, sinks)
+    else:
+        msm_analysis.check_transition(tprob)
 
     if scipy.sparse.issparse(tprob):
         dense = False
@@ -483,7 +556,7 @@ def calculate_fluxes(sources, sinks, tprob, populations=None, committors=None):
     return fluxes
 
 
-def calculate_net_fluxes(sources, sinks, tprob, populations=None, committors=None):
+def calculate_net_fluxes(sources, sinks, tprob, populations=None, committors=None, ctx=None):
     """
     Computes the transition path theory net flux matrix.
 
@@ -509,10 +582,17 @@ def calculate_net_fluxes(sources, sinks, tprob, populations=None, committors=Non
         The committors associated with `sources`, `sinks`, and `tprob`.
         If not provided, is calculated from scratch. If provided, `sources`
         and `sinks` are ignored.
+    ctx : TPTContext
+        Cache of quantities shared between TPT queries on `tprob`. If
+        provided, `tprob` is taken from the context and the shared work
+        (validation, populations, committors) is reused across calls.
     """
 
     sources, sinks = _check_sources_sinks(sources, sinks)
-    msm_analysis.check_transition(tprob)
+    if ctx is not None:
+        tprob = ctx.tprob  # already validated when the context was built
+    else:
+        msm_analysis.check_transition(tprob)
 
     if scipy.sparse.issparse(tprob):
         dense = False
@@ -521,7 +601,7 @@ def calculate_net_fluxes(sources, sinks, tprob, populations=None, committors=Non
 
     n = tprob.shape[0]
 
-    flux = calculate_fluxes(sources, sinks, tprob, populations, committors)
+    flux = calculate_fluxes(sources, sinks, tprob, populations, committors, ctx=ctx)
     ind = flux.nonzero()
 
     if dense:
@@ -573,9 +653,7 @@ def calculate_ensemble_mfpt(sources, sinks, tprob, lag_time):
     msm_analysis.check_transition(tprob)
 
     X = calculate_mfpt(sinks, tprob, lag_time)
-    times = np.zeros(len(sources))
-    for i in range(len(sources)):
-        times[i] = X[ sources[i] ]
+    times = X[np.asarray(sources)]
 
     return np.average(times), np.std(times)
 
@@ -686,7 +764,7 @@ def calculate_mfpt(sinks, tprob, lag_time=1.):
     else:
         tprob = tprob - np.eye(n)
 
-    RHS = -1 * np.ones(n)
+    RHS = np.full(n, -1.0)
     for state in sinks:
         RHS[state] = 0.0
 
@@ -744,16 +822,14 @@ def calculate_all_to_all_mfpt(tprob, populations=None):
     if tprob.shape[0] != num_states:
         raise ValueError("Shape of tprob and populations vector don't match")
 
-    eye = np.transpose( np.matrix(np.ones(num_states)) )
-    limiting_matrix = eye * populations
+    populations = np.asarray(populations)
+    limiting_matrix = np.outer(np.ones(num_states), populations)
     #z = scipy.linalg.inv(scipy.sparse.eye(num_states, num_states) - (tprob - limiting_matrix))
     z = scipy.linalg.inv(np.eye(num_states) - (tprob - limiting_matrix))
 
-    # mfpt[i,j] = z[j,j] - z[i,j] / pi[j]
-    mfpt = -z
-    for j in range(num_states):
-        mfpt[:, j] += z[j, j]
-        mfpt[:, j] /= populations[j]
+    # mfpt[i,j] = (z[j,j] - z[i,j]) / pi[j], assembled as a single broadcast
+    # rather than a per-column python loop
+    mfpt = (z.diagonal() - z) / populations
 
     return mfpt
 
@@ -782,28 +858,30 @@ def calculate_committors(sources, sinks, tprob):
 
     if scipy.sparse.issparse(tprob):
         dense = False
-        tprob = tprob.tolil()
+        tprob = tprob.tocsr()
     else:
         dense = True
 
-    # construct the committor problem
+    # construct the committor problem. the rows and columns belonging to the
+    # sources and sinks are pinned (zeroed, with a 1 on the diagonal); this
+    # is done with masked/diagonal operations rather than mutating the
+    # matrix one state at a time
     n = tprob.shape[0]
 
+    pinned = np.zeros(n, dtype=bool)
+    pinned[sources] = True
+    pinned[sinks] = True
+
     if dense:
         T = np.eye(n) - tprob
+        T[pinned, :] = 0.0
+        T[:, pinned] = 0.0
+        T[pinned, pinned] = 1.0
     else:
-        T = scipy.sparse.eye(n, n, 0, format='lil') - tprob
-        T = T.tolil()
-
-    for a in sources:
-        T[a,:] = 0.0 #np.zeros(n)
-        T[:,a] = 0.0
-        T[a,a] = 1.0
-
-    for b in sinks:
-        T[b,:] = 0.0 # np.zeros(n)
-        T[:,b] = 0.0
-        T[b,b] = 1.0
+        D_free = scipy.sparse.spdiags((~pinned).astype(float), 0, n, n)
+        D_pinned = scipy.sparse.spdiags(pinned.astype(float), 0, n, n)
+        T = scipy.sparse.eye(n, n) - tprob
+        T = (D_free * T * D_free + D_pinned).tocsr()
 
     IdB = np.zeros(n)
     IdB[sinks] = 1.0
@@ -818,7 +896,7 @@ def calculate_committors(sources, sinks, tprob):
 
     # solve for the committors
     if dense == False:
-        Q = scipy.sparse.linalg.spsolve(T.tocsr(), RHS)
+        Q = scipy.sparse.linalg.spsolve(T, RHS)
     else:
         Q = np.linalg.solve(T, RHS)
         
@@ -834,6 +912,64 @@ def calculate_committors(sources, sinks, tprob):
 #
 
 
+def _fraction_visits_core(tprob, waypoint, source, sink, Q, return_cond_Q=False):
+    """
+    Linear-algebra core of `calculate_fraction_visits`.
+
+    Assumes `tprob` is a dense, validated transition matrix, that the
+    source/sink/waypoint arguments are plain disjoint ints, and that `Q`
+    holds the committors for the reaction `source` -> `sink`. Factoring
+    this out lets the hub score functions call it many times without
+    paying for typechecking and committor recomputation on every call.
+
+    See Also
+    --------
+    calculate_fraction_visits : the public (typechecked) version
+    """
+
+    N = tprob.shape[0]
+
+    # permute the transition matrix into cannonical form - send waypoint the the
+    # last row, and source + sink to the end after that
+    Bsink_indices = [source, sink, waypoint]
+    perm = np.arange(N)
+    perm = np.delete(perm, Bsink_indices)
+    perm = np.append(perm, Bsink_indices)
+    T = MSMLib.permute_mat(tprob, perm)
+
+    # extract P, R
+    n = N - len(Bsink_indices)
+    P = T[:n, :n]
+
+    # calculate the conditional committors ( B = N*R ), B[i,j] is the prob
+    # state i ends in j, where j runs over the source + sink + waypoint
+    # (waypoint is position -1). only the waypoint column of B is ever used,
+    # so solve for that single right hand side rather than forming the full
+    # inverse of (I - P)
+    b_col = np.linalg.solve(np.eye(n) - P, np.asarray(T[:n, -1]).flatten())
+
+    # add probs for the sinks, waypoint / b[i] is P( i --> {C & not A, B} )
+    b = np.append(b_col, [0.0] * (len(Bsink_indices) - 1) + [1.0])
+    cond_Q = b * Q[waypoint]
+
+    assert cond_Q.shape == (N,)
+    assert np.all( cond_Q <= 1.0 )
+    assert np.all( cond_Q >= 0.0 )
+    assert np.all( cond_Q <= Q[perm] )
+
+    # finally, calculate the fraction of paths h_C(A,B) (eq. 7 in [1])
+    fraction_paths = np.sum( T[-3,:] * cond_Q ) / np.sum( T[-3,:] * Q[perm] )
+
+    assert fraction_paths <= 1.0
+    assert fraction_paths >= 0.0
+
+    if return_cond_Q:
+        cond_Q = cond_Q[ np.argsort(perm) ] # put back in orig. order
+        return fraction_paths, cond_Q
+    else:
+        return fraction_paths
+
+
 def calculate_fraction_visits(tprob, waypoint, source, sink, return_cond_Q=False):
     """
     Calculate the fraction of times a walker on `tprob` going from `sources` 
@@ -913,47 +1049,10 @@ def calculate_fraction_visits(tprob, waypoint, source, sink, return_cond_Q=False
     if (source == waypoint) or (sink == waypoint) or (sink == source):
         raise ValueError('source, sink, waypoint must all be disjoint!')
 
-    N = tprob.shape[0]
     Q = calculate_committors([source], [sink], tprob)
-    
-    # permute the transition matrix into cannonical form - send waypoint the the
-    # last row, and source + sink to the end after that
-    Bsink_indices = [source, sink, waypoint]
-    perm = np.arange(N)
-    perm = np.delete(perm, Bsink_indices)
-    perm = np.append(perm, Bsink_indices)
-    T = MSMLib.permute_mat(tprob, perm)
-    
-    # extract P, R
-    n = N - len(Bsink_indices)
-    P = T[:n,:n]
-    R = T[:n,n:]
-    
-    # calculate the conditional committors ( B = N*R ), B[i,j] is the prob 
-    # state i ends in j, where j runs over the source + sink + waypoint 
-    # (waypoint is position -1)
-    B = np.dot( np.linalg.inv( np.eye(n) - P ), R )
-    
-    # add probs for the sinks, waypoint / b[i] is P( i --> {C & not A, B} )
-    b = np.append( B[:,-1].flatten(), [0.0]*(len(Bsink_indices)-1) + [1.0] )
-    cond_Q = b * Q[waypoint]
-    
-    assert cond_Q.shape == (N,)
-    assert np.all( cond_Q <= 1.0 )
-    assert np.all( cond_Q >= 0.0 )
-    assert np.all( cond_Q <= Q[perm] )
-    
-    # finally, calculate the fraction of paths h_C(A,B) (eq. 7 in [1])
-    fraction_paths = np.sum( T[-3,:] * cond_Q ) / np.sum( T[-3,:] * Q[perm] )
-    
-    assert fraction_paths <= 1.0
-    assert fraction_paths >= 0.0
-    
-    if return_cond_Q:
-        cond_Q = cond_Q[ np.argsort(perm) ] # put back in orig. order
-        return fraction_paths, cond_Q
-    else:
-        return fraction_paths
+
+    return _fraction_visits_core(tprob, waypoint, source, sink, Q,
+                                 return_cond_Q=return_cond_Q)
 
 
 def calculate_hub_score(tprob, waypoint):
@@ -1011,18 +1110,26 @@ def calculate_hub_score(tprob, waypoint):
         else:
             raise ValueError('Must pass waypoints as int or list/array of ints')
 
+    if type(tprob) != np.ndarray:
+        try:
+            tprob = tprob.todense()
+        except AttributeError as e:
+            raise TypeError('Argument `tprob` must be convertable to a dense'
+                            'numpy array. \n%s' % e)
+
     # find out which states to include in A, B (i.e. everything but C)
     N = tprob.shape[0]
     states_to_include = range(N)
     states_to_include.remove(waypoint)
 
-    # calculate the hub score
+    # calculate the hub score. the committors only depend on (s1, s2), so
+    # they are computed once per pair and shared by the core routine
     Hc = 0.0
     for s1 in states_to_include:
         for s2 in states_to_include:
             if (s1 != s2) and (s1 != waypoint) and (s2 != waypoint):
-                Hc += calculate_fraction_visits(tprob, waypoint, 
-                                                s1, s2, return_cond_Q=False)
+                Q = calculate_committors([s1], [s2], tprob)
+                Hc += _fraction_visits_core(tprob, waypoint, s1, s2, Q)
 
     Hc /= ((N - 1) * (N - 2))
 
@@ -1069,27 +1176,31 @@ def calculate_all_hub_scores(tprob):
         Article ASAP DOI: 10.1021/ct300537s
     """
     
+    msm_analysis.check_transition(tprob)
+    if type(tprob) != np.ndarray:
+        try:
+            tprob = tprob.todense()
+        except AttributeError as e:
+            raise TypeError('Argument `tprob` must be convertable to a dense'
+                            'numpy array. \n%s' % e)
+
     N = tprob.shape[0]
     states = range(N)
 
-    # calculate the hub score
+    # calculate the hub scores. looping over the source/sink pairs in the
+    # outer loops means each pair's committors are solved for only once,
+    # rather than once per (pair, waypoint) triple
     Hc_array = np.zeros(N)
 
-    # loop over each state and compute it's hub score
-    for i,waypoint in enumerate(states):
+    for s1 in states:
+        for s2 in states:
+            if s1 != s2:
+                Q = calculate_committors([s1], [s2], tprob)
+                for waypoint in states:
+                    if (waypoint != s1) and (waypoint != s2):
+                        Hc_array[waypoint] += _fraction_visits_core(tprob, waypoint, s1, s2, Q)
 
-        Hc = 0.0
-        
-        # now loop over all combinations of sources/sinks and average
-        for s1 in states:
-            if waypoint != s1:
-                for s2 in states:
-                    if s1 != s2:
-                        if waypoint != s2:
-                            Hc += calculate_fraction_visits(tprob, waypoint, s1, s2)
-        
-        # store the hub score in an array
-        Hc_array[i] = Hc / ((N - 1) * (N - 2))
+    Hc_array /= ((N - 1) * (N - 2))
 
     return Hc_array
 
@@ -69,9 +69,10 @@ def format_block(block):
     return '\n'.join(lines)+'\n'
 
 
+_keynat_digits = re.compile(r'(\d+)')
+
 def keynat(string):
     '''A natural sort helper function for sort() and sorted()
-    without using regular expression.
 
     >>> items = ('Z', 'a', '10', '1', '9')
     >>> sorted(items)
@@ -79,17 +80,10 @@ def keynat(string):
     >>> sorted(items, key=keynat)
     ['1', '9', '10', 'Z', 'a']
     '''
-    r = []
-    for c in string:
-        try:
-            c = int(c)
-            try:
-                r[-1] = r[-1] * 10 + c
-            except:
-                r.append(c)
-        except:
-            r.append(c)
-    return r
+    # one pass of the precompiled regex per string, instead of a
+    # try/except per character
+    return [int(c) if c.isdigit() else c
+            for c in _keynat_digits.split(string) if c]
 
 
 def _pickle_method(method):